@@ -0,0 +1,183 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""create and update the bigquery tables declared in schema.py
+
+every ``<NAME>_TABLE`` in ``schema`` with a matching ``<NAME>_SCHEMA`` is
+created partitioned by day on its column in ``schema.PARTITION_FIELDS`` and
+clustered on ``schema.CLUSTER_FIELDS``, so queries for a few participants
+over a few days only read those partitions and blocks.
+
+existing tables get the compatible changes: new columns are added,
+required columns are relaxed to nullable, descriptions and clustering are
+updated.  a different partitioning or column type can't be applied in
+place, it is reported and the table is left as is.
+
+Usage::
+
+    flask provision-tables [--dry-run]
+
+Configuration:
+
+    * `GOOGLE_CLOUD_PROJECT`: gcp project where bigquery is available.
+    * `BIGQUERY_DATASET`: dataset holding the tables, created if missing.
+"""
+import logging
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from . import schema
+
+log = logging.getLogger(__name__)
+
+# standard sql names of the legacy types used in schema.py
+_TYPE_ALIASES = {"FLOAT64": "FLOAT", "INT64": "INTEGER", "BOOL": "BOOLEAN"}
+
+
+def _field_type(field_type):
+    field_type = field_type.upper()
+    return _TYPE_ALIASES.get(field_type, field_type)
+
+
+def schema_fields(table_schema):
+    """``bigquery.SchemaField`` list for a schema declared in schema.py"""
+    return [
+        bigquery.SchemaField(
+            field["name"],
+            _field_type(field.get("type", "STRING")),
+            mode=field.get("mode", "NULLABLE"),
+            description=field.get("description"),
+        )
+        for field in table_schema
+    ]
+
+
+def table_specs():
+    """yield ``(table, table_schema)`` for each table declared in schema.py"""
+    for name in sorted(dir(schema)):
+        if not name.endswith("_TABLE"):
+            continue
+        table = getattr(schema, name)
+        table_schema = getattr(schema, name[:-len("_TABLE")] + "_SCHEMA", None)
+        if table and table_schema:
+            yield table, table_schema
+
+
+def table_definition(table_id, table, fields):
+    """``bigquery.Table`` for ``table`` with ``fields``, partitioned and clustered as declared"""
+    columns = [field.name for field in fields]
+    bq_table = bigquery.Table(table_id, schema=fields)
+
+    partition_field = schema.PARTITION_FIELDS.get(table)
+    if partition_field in columns:
+        bq_table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY, field=partition_field
+        )
+    cluster_fields = [field for field in schema.CLUSTER_FIELDS.get(table, []) if field in columns]
+    if cluster_fields:
+        bq_table.clustering_fields = cluster_fields
+
+    return bq_table
+
+
+def _partition_field(bq_table):
+    partitioning = bq_table.time_partitioning
+    return partitioning.field if partitioning else None
+
+
+def _schema_changes(existing, wanted):
+    """new schema for ``existing`` with the compatible changes from ``wanted``, and their list"""
+    wanted_fields = {field.name: field for field in wanted.schema}
+    changes = []
+    fields = []
+    for field in existing.schema:
+        target = wanted_fields.pop(field.name, None)
+        if target is None:
+            fields.append(field)
+            continue
+
+        if _field_type(field.field_type) != target.field_type:
+            log.warning("%s.%s is %s, schema.py declares %s: not changed",
+                        existing.table_id, field.name, field.field_type, target.field_type)
+        mode = field.mode
+        if field.mode == "REQUIRED" and target.mode != "REQUIRED":
+            mode = "NULLABLE"
+            changes.append(f"relax {field.name}")
+        description = field.description
+        if target.description and target.description != field.description:
+            description = target.description
+            changes.append(f"describe {field.name}")
+
+        fields.append(bigquery.SchemaField(
+            field.name, field.field_type, mode=mode, description=description, fields=field.fields
+        ))
+
+    # columns can only be added as nullable
+    for target in wanted_fields.values():
+        fields.append(bigquery.SchemaField(
+            target.name, target.field_type, mode="NULLABLE", description=target.description
+        ))
+        changes.append(f"add {target.name}")
+
+    return fields, changes
+
+
+def _update(client, existing, wanted, dry_run):
+    fields, changes = _schema_changes(existing, wanted)
+    properties = ["schema"] if changes else []
+
+    if (existing.clustering_fields or None) != (wanted.clustering_fields or None):
+        changes.append(f"cluster on {wanted.clustering_fields}")
+        properties.append("clustering_fields")
+
+    if _partition_field(existing) != _partition_field(wanted):
+        log.warning("%s is partitioned on %s, schema.py declares %s: recreate the table to change it",
+                    existing.table_id, _partition_field(existing), _partition_field(wanted))
+
+    if properties and not dry_run:
+        existing.schema = fields
+        existing.clustering_fields = wanted.clustering_fields
+        client.update_table(existing, properties)
+
+    return changes
+
+
+def provision(client, dataset, dry_run=False):
+    """create the missing tables of ``dataset`` and update the others
+
+    returns ``{table: [change, ...]}`` for the tables that were (or, with
+    ``dry_run``, would be) changed.
+    """
+    if not dry_run:
+        client.create_dataset(dataset, exists_ok=True)
+
+    changed = {}
+    for table, table_schema in table_specs():
+        wanted = table_definition(
+            f"{client.project}.{dataset}.{table}", table, schema_fields(table_schema)
+        )
+        try:
+            existing = client.get_table(wanted.reference)
+        except NotFound:
+            changed[table] = ["create"]
+            if not dry_run:
+                client.create_table(wanted)
+            continue
+
+        changes = _update(client, existing, wanted, dry_run)
+        if changes:
+            changed[table] = changes
+
+    return changed
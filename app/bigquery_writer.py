@@ -0,0 +1,388 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""buffered, batched loading of dataframes into bigquery
+
+Loading every (user, activity) dataframe on its own starts thousands of
+small load jobs per run.  ``BigQueryWriter`` gathers the dataframes written
+for each table and loads them together as a single parquet file, so a run
+costs roughly one load job per table.
+
+dataframes are converted to arrow tables with ``to_arrow`` as they are
+written, so the buffers hold typed columns, with the strings dictionary
+encoded, rather than python objects.  at load time the buffered tables are
+concatenated without copying and written straight to parquet.
+
+With the "merge" write mode, the rows are loaded into a staging table and
+then merged into the table on its natural key (``schema.MERGE_KEYS``), so
+ingesting the same days again replaces the rows instead of duplicating
+them.  tables the writer creates are partitioned and clustered as declared
+in schema.py (see ``bigquery_provision``), so merging a day only touches
+that day's partition.
+
+Example::
+
+    with BigQueryWriter(project_id, "fitbit") as writer:
+        for user in users:
+            writer.write(df, schema.INTRADAY_STEPS_TABLE, schema.INTRADAY_STEPS_SCHEMA)
+
+    leaving the ``with`` block flushes whatever is still buffered.
+
+Configuration:
+
+    * `BIGQUERY_FLUSH_ROWS`: optional, buffered rows for a table that
+        trigger a load (default 1000000).
+    * `BIGQUERY_FLUSH_SECONDS`: optional, a table is also loaded on the next
+        write once its oldest buffered dataframe is this old (default 300).
+    * `BIGQUERY_WRITE_MODE`: optional, "merge" (the default) to upsert rows
+        on the tables' natural keys, or "append" to always add them.
+"""
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from . import metrics
+from . import schema
+from .bigquery_provision import table_definition
+
+log = logging.getLogger(__name__)
+
+flush_rows = int(os.environ.get("BIGQUERY_FLUSH_ROWS", 1000000))
+flush_seconds = float(os.environ.get("BIGQUERY_FLUSH_SECONDS", 300))
+write_mode = os.environ.get("BIGQUERY_WRITE_MODE", "merge")
+
+# staging tables are deleted after the merge, and expire in case that fails
+STAGING_EXPIRATION = timedelta(days=1)
+
+# arrow types used for the bigquery types declared in schema.py
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "FLOAT": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "DATE": pa.date32(),
+}
+
+
+def _bigquery_type(arrow_type):
+    """bigquery type for a column that has no declared type"""
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if pa.types.is_integer(arrow_type):
+        return "INTEGER"
+    if pa.types.is_floating(arrow_type):
+        return "FLOAT"
+    if pa.types.is_boolean(arrow_type):
+        return "BOOLEAN"
+    if pa.types.is_timestamp(arrow_type):
+        return "TIMESTAMP"
+    if pa.types.is_date(arrow_type):
+        return "DATE"
+    return "STRING"
+
+
+def _column_to_arrow(series, field_type):
+    arrow_type = ARROW_TYPES.get(field_type)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if field_type in ("", "STRING"):
+            # keep the categories as the dictionary, with the int32 indices
+            # of the other string columns so that tables concatenate
+            return pa.array(series, from_pandas=True).cast(pa.dictionary(pa.int32(), pa.string()))
+        series = series.astype(object)
+    if field_type == "INTEGER" and pd.api.types.is_integer_dtype(series.dtype):
+        # the downcast integers of the parsers stay narrow, they load
+        # into INTEGER columns all the same
+        arrow_type = None
+    if field_type == "TIMESTAMP":
+        series = pd.to_datetime(series, utc=True)
+    elif field_type == "DATE":
+        series = pd.to_datetime(series).dt.date
+    array = pa.array(series, type=arrow_type, from_pandas=True)
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        array = array.cast(pa.string()).dictionary_encode()
+    return array
+
+
+def constant_column(value, rows):
+    """dictionary encoded column of ``rows`` times the string ``value``, stored once"""
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(rows, dtype=np.int32)), pa.array([value]))
+
+
+def bigquery_schema(arrow_schema, table_schema):
+    """bigquery schema of an arrow table built by ``to_arrow``
+
+    columns declared in ``table_schema`` get the declared type, the others
+    get a type inferred from the data, as ``pandas_gbq`` does.
+    """
+    declared = {field["name"]: field for field in table_schema or []}
+    fields = []
+    for arrow_field in arrow_schema:
+        field = declared.get(arrow_field.name, {})
+        fields.append(
+            bigquery.SchemaField(
+                arrow_field.name,
+                field.get("type", "").upper() or _bigquery_type(arrow_field.type),
+                mode=field.get("mode", "NULLABLE"),
+                description=field.get("description"),
+            )
+        )
+    return fields
+
+
+def to_arrow(df, table_schema, constants=None):
+    """convert ``df`` to an arrow table and matching bigquery schema.
+
+    columns declared in ``table_schema`` get the declared type.  string
+    columns are dictionary encoded.  ``constants``, ``{column: value}``,
+    are added in front as string columns holding the same value on every
+    row, e.g. the user id.
+    """
+    arrays = [constant_column(value, df.shape[0]) for value in (constants or {}).values()]
+    names = list(constants or {})
+
+    declared = {field["name"]: field.get("type", "").upper() for field in table_schema or []}
+    for column in df.columns:
+        arrays.append(_column_to_arrow(df[column], declared.get(column, "")))
+        names.append(column)
+
+    arrow_table = pa.Table.from_arrays(arrays, names=names)
+    return arrow_table, bigquery_schema(arrow_table.schema, table_schema)
+
+
+def _merge_query(target, staging, columns, keys, partition_field=None):
+    """MERGE statement upserting ``staging`` into ``target`` on ``keys``
+
+    rows of ``staging`` with the same key are deduplicated first, as MERGE
+    fails when several source rows match one target row.  with a
+    ``partition_field``, the target rows are restricted to the range
+    ``@partition_min`` to ``@partition_max`` so only those partitions are
+    scanned.
+    """
+    key_list = ", ".join(f"`{key}`" for key in keys)
+    on = " AND ".join(f"T.`{key}` = S.`{key}`" for key in keys)
+    if partition_field:
+        on += f" AND T.`{partition_field}` BETWEEN @partition_min AND @partition_max"
+
+    column_list = ", ".join(f"`{column}`" for column in columns)
+    source_list = ", ".join(f"S.`{column}`" for column in columns)
+    updates = ", ".join(f"`{column}` = S.`{column}`" for column in columns if column not in keys)
+
+    query = (
+        f"MERGE `{target}` T\n"
+        f"USING (\n"
+        f"  SELECT * EXCEPT (_row) FROM (\n"
+        f"    SELECT *, ROW_NUMBER() OVER (PARTITION BY {key_list}) AS _row FROM `{staging}`\n"
+        f"  ) WHERE _row = 1\n"
+        f") S\n"
+        f"ON {on}\n"
+    )
+    if updates:
+        query += f"WHEN MATCHED THEN UPDATE SET {updates}\n"
+    query += f"WHEN NOT MATCHED THEN INSERT ({column_list}) VALUES ({source_list})"
+    return query
+
+
+class BigQueryWriter:
+    """Buffers arrow tables per table and loads them in large batches.
+
+    Args:
+        project_id: gcp project for the bigquery client.
+        dataset: bigquery dataset holding the tables.
+        max_rows: load a table once this many rows are buffered for it.
+        max_seconds: load a table on the next write once its oldest
+            buffered dataframe is older than this.
+        client: optional ``bigquery.Client``, created on first use if not
+            provided.
+        mode: "merge" or "append", see the module documentation.  tables
+            without a natural key in ``schema.MERGE_KEYS`` are appended to.
+        timings: optional ``metrics.Timings`` the loads are added to.
+
+    ``write`` may be called from several threads at once.  tables that
+    failed to load are listed in ``failed``.
+    """
+
+    def __init__(self, project_id, dataset, max_rows=None, max_seconds=None, client=None, mode=None,
+                 timings=None):
+        self.project_id = project_id
+        self.dataset = dataset
+        self.max_rows = max_rows or flush_rows
+        self.max_seconds = max_seconds or flush_seconds
+        self.mode = mode or write_mode
+        self.timings = timings
+        self._client = client
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self.failed = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = bigquery.Client(project=self.project_id)
+        return self._client
+
+    def table_id(self, table):
+        return f"{self.dataset}.{table}"
+
+    def full_table_id(self, table):
+        return f"{self.client.project}.{self.dataset}.{table}"
+
+    def write(self, data, table, table_schema):
+        """buffer ``data`` for ``table``, loading the table if a threshold is reached
+
+        ``data`` is an arrow table built by ``to_arrow``, or a dataframe
+        that is converted with it.
+        """
+        if isinstance(data, pd.DataFrame):
+            data, _ = to_arrow(data, table_schema)
+        if data.num_rows == 0:
+            return
+
+        with self._lock:
+            buffer = self._buffers.setdefault(
+                table, {"tables": [], "rows": 0, "since": time.monotonic(), "schema": table_schema}
+            )
+            buffer["tables"].append(data)
+            buffer["rows"] += data.num_rows
+            full = (
+                buffer["rows"] >= self.max_rows
+                or time.monotonic() - buffer["since"] >= self.max_seconds
+            )
+            if full:
+                del self._buffers[table]
+
+        if full:
+            self._load(table, buffer)
+
+    def flush(self, table=None):
+        """load everything buffered, or only what is buffered for ``table``"""
+        with self._lock:
+            tables = [table] if table else list(self._buffers)
+            buffers = [(t, self._buffers.pop(t)) for t in tables if t in self._buffers]
+
+        for t, buffer in buffers:
+            self._load(t, buffer)
+
+    def _load(self, table, buffer):
+        try:
+            with metrics.span("load", table, self.timings):
+                arrow_table = pa.concat_tables(buffer["tables"], promote_options="permissive")
+                bq_schema = bigquery_schema(arrow_table.schema, buffer["schema"])
+
+                bq_table = self._ensure_table(table, bq_schema)
+                keys = schema.MERGE_KEYS.get(table)
+                if self.mode == "merge" and keys:
+                    self._add_columns(bq_table, bq_schema)
+                    self._merge(table, arrow_table, bq_schema, keys)
+                else:
+                    self._load_parquet(self.table_id(table), arrow_table, bq_schema)
+            metrics.ROWS.inc(arrow_table.num_rows, table=table)
+            log.debug("loaded %d rows into %s", arrow_table.num_rows, self.table_id(table))
+        except Exception as e:
+            self.failed.add(table)
+            log.error("exception occurred while loading '%s': %s", table, e)
+
+    def _ensure_table(self, table, bq_schema):
+        """get ``table``, creating it partitioned and clustered if it does not exist yet"""
+        try:
+            return self.client.get_table(self.table_id(table))
+        except NotFound:
+            pass
+
+        bq_table = table_definition(self.full_table_id(table), table, bq_schema)
+        return self.client.create_table(bq_table, exists_ok=True)
+
+    def _load_parquet(self, table_id, arrow_table, bq_schema,
+                      write_disposition=bigquery.WriteDisposition.WRITE_APPEND):
+        parquet = io.BytesIO()
+        pq.write_table(arrow_table, parquet)
+        parquet.seek(0)
+
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=write_disposition,
+            schema=bq_schema,
+        )
+        if write_disposition == bigquery.WriteDisposition.WRITE_APPEND:
+            job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+        job = self.client.load_table_from_file(parquet, table_id, job_config=job_config)
+        job.result()
+
+    def _merge(self, table, arrow_table, bq_schema, keys):
+        """load into a staging table, then merge it into ``table`` on ``keys``"""
+        staging = self.full_table_id(f"{table}_staging_{uuid.uuid4().hex[:12]}")
+        staging_table = bigquery.Table(staging, schema=bq_schema)
+        staging_table.expires = datetime.now(timezone.utc) + STAGING_EXPIRATION
+        self.client.create_table(staging_table)
+        try:
+            self._load_parquet(
+                staging, arrow_table, bq_schema, bigquery.WriteDisposition.WRITE_TRUNCATE
+            )
+
+            partition_field = schema.PARTITION_FIELDS.get(table)
+            parameters = self._partition_range(arrow_table, bq_schema, partition_field)
+            query = _merge_query(
+                self.full_table_id(table),
+                staging,
+                arrow_table.column_names,
+                keys,
+                partition_field if parameters else None,
+            )
+            job_config = bigquery.QueryJobConfig(query_parameters=parameters)
+            self.client.query(query, job_config=job_config).result()
+        finally:
+            self.client.delete_table(staging, not_found_ok=True)
+
+    def _add_columns(self, bq_table, bq_schema):
+        """add the columns of ``bq_schema`` missing from ``bq_table``, MERGE does not add them"""
+        existing = {field.name for field in bq_table.schema}
+        missing = [field for field in bq_schema if field.name not in existing]
+        if missing:
+            bq_table.schema = list(bq_table.schema) + missing
+            self.client.update_table(bq_table, ["schema"])
+
+    @staticmethod
+    def _partition_range(arrow_table, bq_schema, partition_field):
+        """query parameters bounding ``partition_field`` in ``arrow_table``, if there is one"""
+        field_types = {field.name: field.field_type for field in bq_schema}
+        if field_types.get(partition_field) not in ("TIMESTAMP", "DATE"):
+            return []
+
+        bounds = pc.min_max(arrow_table[partition_field]).as_py()
+        if bounds["min"] is None:
+            return []
+
+        field_type = field_types[partition_field]
+        return [
+            bigquery.ScalarQueryParameter("partition_min", field_type, bounds["min"]),
+            bigquery.ScalarQueryParameter("partition_max", field_type, bounds["max"]),
+        ]
@@ -15,7 +15,9 @@
 """Classes and functions for interfacing with Cloud Firestore.
 
 Module provides classes for managing state in a backend firestore
-dataset.  Currently this includes ``FirestoreStorage`` class.
+dataset.  Currently this includes ``FirestoreStorage`` class for oauth
+tokens, ``WatermarkStore`` for incremental ingestion and ``RunLedger``
+for the status of ingestion runs.
 
 Configuration:
     Uses the standard mechanisms to initialize google cloud authentication.
@@ -26,9 +28,16 @@ Configuration:
 
     If those are not set, will use default application credentials.
 
+    * `TOKEN_CACHE_SECONDS`: optional, how long a token read from firestore
+        is reused before it is read again (default 300, 0 disables the cache).
+
 .. _Google Authentication:
     https://cloud.google.com/docs/authentication
 """
+import os
+import threading
+import time
+
 from flask_dance.consumer.storage import BaseStorage
 import firebase_admin
 from firebase_admin import firestore
@@ -41,6 +50,18 @@ from firebase_admin import firestore
 firebase_admin.initialize_app()
 db = firestore.client()
 
+token_cache_seconds = float(os.environ.get("TOKEN_CACHE_SECONDS", 300))
+
+# field set on a token document whose refresh token was rejected by fitbit
+REFRESH_FAILED = "refresh_failed"
+
+# users read per firestore query by ``FirestoreStorage.all_users``
+USER_PAGE_SIZE = 500
+
+# cached tokens this close to expiring are read again, in case another
+# instance already refreshed them
+EXPIRY_MARGIN = 60
+
 
 class FirestoreStorage(BaseStorage):
     """Firestore backend for flask-dance oauth token storage.
@@ -58,40 +79,210 @@ class FirestoreStorage(BaseStorage):
 
             see `flask dance storage`_. for specification.
 
+        tokens are cached for ``cache_seconds`` (`TOKEN_CACHE_SECONDS`), or
+        until shortly before they expire if that is sooner.  writes and
+        deletes through this instance update the cache as well.
+
     .. _flask dance storage:
         https://flask-dance.readthedocs.io/en/latest/storages.html
     """
 
-    def __init__(self, collection):
+    def __init__(self, collection, cache_seconds=None):
 
         super(FirestoreStorage, self).__init__()
 
         self.collection = db.collection(collection)
         self.user = None
+        self.cache_seconds = token_cache_seconds if cache_seconds is None else cache_seconds
+        self._cache = {}
+        self._cache_lock = threading.Lock()
 
     def get(self, blueprint):
+        return self.load(self.user)
 
+    def set(self, blueprint, token):
+        self.save(self.user, token)
+
+    def delete(self, blueprint):
         if self.user:
-            doc_ref = self.collection.document(self.user)
-            doc = doc_ref.get()
+            self._uncache(self.user)
+            self.collection.document(self.user).delete()
 
-            if doc.exists:
-                return dict(doc.to_dict())
+    def all_users(self, page_size=USER_PAGE_SIZE, include_failed=False):
+        """yield the id of every user with a token, one page at a time
 
-        return {}
+        only the document names and ``refresh_failed`` markers are read, not
+        the tokens themselves.  users whose refresh token was rejected are
+        skipped unless ``include_failed`` is set.
+        """
+        query = self.collection.select([REFRESH_FAILED]).order_by("__name__").limit(page_size)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last else query).stream())
+            for doc in page:
+                if include_failed or not (doc.to_dict() or {}).get(REFRESH_FAILED):
+                    yield doc.id
+            if len(page) < page_size:
+                return
+            last = page[-1]
 
-    def set(self, blueprint, token):
+    def has_user(self, user):
+        """true if ``user`` has a token, which is cached for the requests that follow"""
+        return bool(self.load(user))
 
-        if self.user:
-            self.collection.document(self.user).set(token)
+    def load(self, user, cached=True):
+        """read the token for ``user`` without changing ``self.user``
 
-    def delete(self, blueprint):
-        if self.user:
-            self.collection.document(self.user).delete()
+        the cache is bypassed unless ``cached``, the token read replaces the
+        cached one.
+        """
+        if not user:
+            return {}
+
+        token = self._cached(user) if cached else None
+        if token is not None:
+            return token
 
-    def all_users(self):
-        return [doc.id for doc in self.collection.stream()]
+        doc = self.collection.document(user).get()
+        if not doc.exists:
+            return {}
+
+        token = dict(doc.to_dict())
+        self._cache_token(user, token)
+        return dict(token)
 
     def save(self, user, token):
         if user:
             self.collection.document(user).set(token)
+            self._cache_token(user, dict(token))
+
+    def mark_refresh_failed(self, user, reason, refresh_token=None):
+        """flag the token of ``user`` as no longer refreshable, returning true if it was.
+
+        with the ``refresh_token`` fitbit rejected, the stored token is read
+        again, bypassing the cache, and only flagged if it still holds that
+        refresh token.  otherwise another process used it first and stored
+        the token it got in exchange, which is valid.
+
+        the flag is cleared when the user authorizes again, as that replaces
+        the whole token document.
+        """
+        if not user:
+            return False
+
+        self._uncache(user)
+        doc_ref = self.collection.document(user)
+        if refresh_token is not None:
+            doc = doc_ref.get()
+            if doc.exists and (doc.to_dict() or {}).get("refresh_token") != refresh_token:
+                return False
+        doc_ref.set({REFRESH_FAILED: reason or True}, merge=True)
+        return True
+
+    def _cached(self, user):
+        with self._cache_lock:
+            entry = self._cache.get(user)
+            if entry is None:
+                return None
+
+            token, cached_at = entry
+            expires_at = token.get("expires_at")
+            now = time.time()
+            if (now - cached_at >= self.cache_seconds
+                    or (expires_at and expires_at < now + EXPIRY_MARGIN)):
+                del self._cache[user]
+                return None
+
+            return dict(token)
+
+    def _cache_token(self, user, token):
+        if self.cache_seconds > 0:
+            with self._cache_lock:
+                self._cache[user] = (token, time.time())
+
+    def _uncache(self, user):
+        with self._cache_lock:
+            self._cache.pop(user, None)
+
+
+class WatermarkStore:
+    """Last ingested date per user and resource, for incremental ingestion.
+
+        Examples of use::
+
+            watermarks = WatermarkStore("tokens_watermarks")
+            watermarks.set("user@domain.com", {"SleepLog": "2022-03-01"})
+            watermarks.get("user@domain.com")["SleepLog"]
+
+            each user has one document, holding a "YYYY-MM-DD" date for
+            each resource (``fitbit_classes`` class name) ingested for them.
+    """
+
+    def __init__(self, collection):
+        self.collection = db.collection(collection)
+
+    def get(self, user):
+        doc = self.collection.document(user).get()
+        if doc.exists:
+            return dict(doc.to_dict())
+
+        return {}
+
+    def set(self, user, watermarks):
+        """update some of the watermarks of ``user``, leaving the others"""
+        if user and watermarks:
+            self.collection.document(user).set(watermarks, merge=True)
+
+
+class RunLedger:
+    """Status of each unit of work of the ingestion runs.
+
+        Examples of use::
+
+            ledger = RunLedger("tokens_runs")
+            ledger.start(run_id, {"start": "2022-03-01", "end": "2022-03-01"})
+            ledger.record(run_id, {
+                ("user@domain.com", "SleepLog", "2022-03-01"): {"status": "loaded", "rows": 42},
+            })
+            loaded = [unit for unit in ledger.units(run_id) if unit["status"] == "loaded"]
+
+            each run has one document holding its parameters, with a
+            ``units`` subcollection holding a document per user, resource
+            (``fitbit_classes`` class name) and first day fetched.
+    """
+
+    def __init__(self, collection):
+        self.collection = db.collection(collection)
+
+    def start(self, run_id, params):
+        self.collection.document(run_id).set(dict(params, created=time.time()))
+
+    def run(self, run_id):
+        """parameters of ``run_id``, or None for an unknown run"""
+        doc = self.collection.document(run_id).get()
+        if doc.exists:
+            return dict(doc.to_dict())
+
+        return None
+
+    def record(self, run_id, units):
+        """merge ``{(user, resource, date): fields}`` into the units of ``run_id``"""
+        units_ref = self.collection.document(run_id).collection("units")
+        batch = db.batch()
+        for n, ((user, resource, date), fields) in enumerate(units.items(), 1):
+            doc_ref = units_ref.document(f"{user}|{resource}|{date}")
+            fields = dict(fields, user=user, resource=resource, date=date, updated=time.time())
+            batch.set(doc_ref, fields, merge=True)
+            # firestore limits a batch to 500 writes
+            if n % 500 == 0:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+
+    def units(self, run_id, user=None):
+        """yield the units recorded for ``run_id``, or only those of ``user``"""
+        query = self.collection.document(run_id).collection("units")
+        if user:
+            query = query.where("user", "==", user)
+        for doc in query.stream():
+            yield doc.to_dict()
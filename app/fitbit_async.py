@@ -0,0 +1,162 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""asyncio client for the fitbit web apis
+
+``FitbitUserSession`` is synchronous, so a user's requests are sent one
+after the other and every session opens its own connections.
+``AsyncFitbitClient`` sends the requests of all users through a single
+pool of keep-alive connections, and lets a user's requests run
+concurrently.
+
+requests are authorized with the user's bearer token from the
+blueprint's storage.  tokens about to expire are refreshed with
+``FitbitUserSession.refresh``, so the refresh locking and the marking of
+rejected refresh tokens are the same as for the synchronous sessions.
+requests are scheduled through the same ``RateLimiter`` and retried in the
+same way.
+
+Example::
+
+    async with AsyncFitbitClient(fitbit_bp) as client:
+        responses = await asyncio.gather(
+            client.get(user, fitbit_classes.StepsIntraday.url("-", "2022-03-01")),
+            client.get(user, fitbit_classes.HrvIntraday.url("-", "2022-03-01")),
+        )
+
+Configuration:
+
+    * `FITBIT_MAX_CONNECTIONS`: optional, connections the client keeps open
+        to the fitbit api (default 20).
+"""
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from . import fitbit_rate_limit
+from .fitbit_session import EXPIRY_MARGIN, FitbitUserSession
+
+log = logging.getLogger(__name__)
+
+max_connections = int(os.environ.get("FITBIT_MAX_CONNECTIONS", 20))
+
+
+class AsyncFitbitClient:
+    """Shared, pooled asyncio client for the requests of many users.
+
+    Args:
+        blueprint: the flask-dance fitbit blueprint, for the api url, the
+            token storage and refreshing tokens.
+        rate_limiter: ``RateLimiter`` used to schedule requests, defaults to
+            the one shared by the whole process.
+        max_retries: number of retries for 429, 5xx and connection errors.
+        max_connections: size of the connection pool.
+        transport: optional ``httpx`` transport, for tests.
+
+    Use it as an async context manager, the connections are closed on exit.
+    an instance belongs to the event loop it was created in.
+    """
+
+    def __init__(self, blueprint, rate_limiter=None, max_retries=None,
+                 max_connections=max_connections, transport=None):
+        self.blueprint = blueprint
+        self.storage = blueprint.storage
+        self.rate_limiter = rate_limiter or fitbit_rate_limit.rate_limiter
+        self.max_retries = fitbit_rate_limit.max_retries if max_retries is None else max_retries
+        self._tokens = {}
+        self._client = httpx.AsyncClient(
+            base_url=str(blueprint.base_url),
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def token(self, user, rejected=None):
+        """``user``'s token, refreshed first if it is about to expire
+
+        ``rejected``, an access token fitbit refused, is replaced with a new
+        one, unless another request of the user did that already.
+        """
+        token = self._tokens.get(user)
+        if token is None:
+            token = await asyncio.to_thread(self.storage.load, user)
+        if rejected and token.get("access_token") != rejected:
+            rejected = None
+
+        expires_at = token.get("expires_at")
+        if rejected or (expires_at and expires_at < time.time() + EXPIRY_MARGIN):
+            token = await asyncio.to_thread(self._refresh, user, rejected)
+
+        self._tokens[user] = token
+        return token
+
+    def _refresh(self, user, rejected=None):
+        session = FitbitUserSession(user, self.blueprint, rate_limiter=self.rate_limiter)
+        if not session.token:
+            return {}
+        return session.refresh(rejected=rejected)
+
+    async def get(self, user, url, **kwargs):
+        return await self.request("GET", user, url, **kwargs)
+
+    async def request(self, method, user, url, **kwargs):
+        """send a request for ``user``, with rate limiting and retries"""
+        attempt = 0
+        refreshed = False
+        headers = dict(kwargs.pop("headers", None) or {})
+        while True:
+            token = await self.token(user)
+            headers["Authorization"] = f"Bearer {token.get('access_token')}"
+
+            await self.rate_limiter.acquire_async(user)
+            try:
+                resp = await self._client.request(method, url, headers=headers, **kwargs)
+            except (httpx.ConnectError, httpx.ReadError, httpx.TimeoutException) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = fitbit_rate_limit.backoff(attempt)
+                log.warning("%s failed (%s), retrying in %.1fs", url, e, delay)
+            else:
+                self.rate_limiter.update(user, resp.headers)
+                if resp.status_code == 401 and not refreshed:
+                    # revoked or expired early, try once more with a new token
+                    refreshed = True
+                    await self.token(user, rejected=token.get("access_token"))
+                    continue
+                if (resp.status_code not in fitbit_rate_limit.RETRY_STATUS
+                        or attempt >= self.max_retries):
+                    return resp
+                if resp.status_code == 429:
+                    delay = fitbit_rate_limit.backoff(0)
+                else:
+                    delay = fitbit_rate_limit.backoff(attempt)
+                log.warning("%s: %d [%s], retrying in %.1fs",
+                            url, resp.status_code, resp.reason_phrase, delay)
+
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -43,6 +43,8 @@ Configuration:
         * `FIRESTORE_DATASET`: specifies the firestore dataset to use for
             storage of oauth tokens.
         * `BIGQUERY_DATASET`: dataset to use to store user data.
+        * `FITBIT_API_URL`: optional, base url of the fitbit web api, e.g.
+            a local stand-in for load tests (default https://api.fitbit.com/).
 
 .. _flask-dance:
     https://flask-dance.readthedocs.io/
@@ -54,12 +56,12 @@ import logging
 
 import pandas as pd
 import pandas_gbq
-from skimpy import clean_columns
 
 from flask import Blueprint, redirect, url_for, session
 from flask_dance.contrib.fitbit import fitbit, make_fitbit_blueprint
 
-from .firestore_storage import FirestoreStorage
+from .firestore_storage import FirestoreStorage, RunLedger, WatermarkStore
+from .fitbit_classes.util import clean_names
 
 FITBIT_SCOPES = [
     "activity",
@@ -77,6 +79,11 @@ firestore_datasetname = os.environ.get("FIRESTORE_DATASET")
 if not firestore_datasetname:
     firestore_datasetname = "tokens"
 firestorage = FirestoreStorage(firestore_datasetname)
+watermarks = WatermarkStore(firestore_datasetname + "_watermarks")
+run_ledger = RunLedger(firestore_datasetname + "_runs")
+# date and digest of the last response loaded for the snapshot resources,
+# e.g. {"Badges": {"date": "2022-03-01", "digest": "..."}}
+snapshots = WatermarkStore(firestore_datasetname + "_snapshots")
 
 fitbit_bp = make_fitbit_blueprint(
     client_id=os.environ.get("FITBIT_OAUTH_CLIENT_ID"),
@@ -85,6 +92,11 @@ fitbit_bp = make_fitbit_blueprint(
     redirect_to="fitbit_auth_bp.device_registration",
     storage=firestorage,
 )
+fitbit_api_url = os.environ.get("FITBIT_API_URL")
+if fitbit_api_url:
+    fitbit_bp.base_url = fitbit_api_url
+    fitbit_bp.token_url = fitbit_api_url.rstrip("/") + "/oauth2/token"
+    fitbit_bp.auto_refresh_url = fitbit_bp.token_url
 bp = Blueprint("fitbit_auth_bp", __name__)
 
 log = logging.getLogger(__name__)
@@ -160,7 +172,7 @@ def _normalize_response(df, column_list, user_email):
     df.insert(0, "id", user_email)
     df.insert(1, "date", date_pulled)
     df.insert(14, "surgery_date", date_pulled)
-    df = clean_columns(df)
+    df = clean_names(df)
 
     return df
 
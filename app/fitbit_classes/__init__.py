@@ -7,4 +7,10 @@ from .intraday_elevation import ElevationIntraday
 from .intraday_calories import CaloriesIntraday
 from .intraday_spo2 import Spo2Intraday
 from .intraday_breathing_rate import BreathingRateIntraday
-from .sleep_log import SleepLog
\ No newline at end of file
+from .sleep_log import SleepLog
+from .daily_activity import DailyActivitySummary, ActivityLogs, ActivityGoals
+from .body_weight import BodyWeight
+from .nutrition import NutritionSummary, NutritionLogs, NutritionGoals
+from .devices import Devices
+from .badges import Badges
+from .social import Social
@@ -1,16 +1,49 @@
+import datetime
+
+from .util import compact
+
 
 class FitbitApiClass:
 
+    # longest range of days a single request can cover.  classes with a
+    # fitbit date range endpoint raise this, and accept `end_date` in url()
+    MAX_RANGE_DAYS = 1
+
+    # schema.py columns of `dataframe`.  their declared types give it
+    # category strings and the smallest integers, see util.compact
+    SCHEMA = None
+
     def __init__(self, json_dict):
         self._dict = json_dict
         self._df = None
+        self._compacted = False
 
     @classmethod
     def url(cls, user, date):
         raise NotImplementedError()
 
+    @classmethod
+    def date_ranges(cls, start, end):
+        """split the days from `start` to `end` into (first, last) pairs, one per request"""
+        first = datetime.date.fromisoformat(start)
+        end = datetime.date.fromisoformat(end)
+        while first <= end:
+            last = min(first + datetime.timedelta(days=cls.MAX_RANGE_DAYS - 1), end)
+            yield first.isoformat(), last.isoformat()
+            first = last + datetime.timedelta(days=1)
+
+    @classmethod
+    def range_url(cls, user, start, end):
+        """url for the days `start` to `end`, which must fit in MAX_RANGE_DAYS"""
+        if start == end:
+            return cls.url(user, start)
+        return cls.url(user, start, end_date=end)
+
     @property
     def dataframe(self):
+        if self.SCHEMA and self._df is not None and not self._compacted:
+            self._df = compact(self._df, self.SCHEMA)
+            self._compacted = True
         return self._df
 
     @property
@@ -1,5 +1,5 @@
 import pandas as pd
-from . util import normalize
+from . util import normalize, intraday_dataframe
 from . _base import FitbitSummary, FitbitIntraday
 
 
@@ -29,8 +29,7 @@ class ActivityIntraday(FitbitIntraday):
 
         self._summary = ActivitySummary(json_dict, self.ACTIVITY_TYPE)
         activities_intraday = json_dict[f"activities-{self.ACTIVITY_TYPE}-intraday"]
-        self._df = pd.json_normalize(activities_intraday, "dataset")
-        self._df = normalize(self._df, self._summary.date, self._df["time"])
+        self._df = intraday_dataframe(self._summary.date, activities_intraday["dataset"])
         self._df.rename(columns={"value": self.ACTIVITY_TYPE}, inplace=True)
 
     @classmethod
@@ -0,0 +1,66 @@
+from .util import records_dataframe
+from ._base import FitbitApiClass
+from .. import schema
+
+
+class Badges(FitbitApiClass):
+    SCHEMA = schema.BADGES_SCHEMA
+
+    COLUMNS = {
+        "badge_gradient_end_color": "badgeGradientEndColor",
+        "badge_gradient_start_color": "badgeGradientStartColor",
+        "badge_type": "badgeType",
+        "category": "category",
+        "date_time": "dateTime",
+        "description": "description",
+        "image_100px": "image100px",
+        "image_125px": "image125px",
+        "image_300px": "image300px",
+        "image_50px": "image50px",
+        "image_75px": "image75px",
+        "name": "name",
+        "share_image_640px": "shareImage640px",
+        "share_text": "shareText",
+        "short_name": "shortName",
+        "times_achieved": "timesAchieved",
+        "value": "value",
+        "unit": "unit",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe(json_dict.get("badges", []), self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date=None):
+        return f"/1/user/{user}/badges.json"
+
+
+if __name__ == "__main__":
+    json_dict = {
+        "badges": [
+            {
+                "badgeGradientEndColor": "B0DF2A",
+                "badgeGradientStartColor": "00A550",
+                "badgeType": "DAILY_STEPS",
+                "category": "Daily Steps",
+                "dateTime": "2019-02-28",
+                "description": "10,000 steps in a day",
+                "image100px": "https://www.gstatic.com/fitbit/badge/images/badges_new/100px/badge_daily_steps10k.png",
+                "image125px": "https://www.gstatic.com/fitbit/badge/images/badges_new/125px/badge_daily_steps10k.png",
+                "image300px": "https://www.gstatic.com/fitbit/badge/images/badges_new/300px/badge_daily_steps10k.png",
+                "image50px": "https://www.gstatic.com/fitbit/badge/images/badges_new/badge_daily_steps10k.png",
+                "image75px": "https://www.gstatic.com/fitbit/badge/images/badges_new/75px/badge_daily_steps10k.png",
+                "name": "Sneakers (10,000 steps in a day)",
+                "shareImage640px": "https://www.gstatic.com/fitbit/badge/images/badges_new/386px/shareLocalized/en_US/badge_daily_steps10k.png",
+                "shareText": "I took 10,000 steps and earned the Sneakers badge! #Fitbit",
+                "shortName": "Sneakers",
+                "timesAchieved": 12,
+                "value": 10000,
+                "unit": "STEPS"
+            }
+        ]
+    }
+
+    print(Badges(json_dict).dataframe)
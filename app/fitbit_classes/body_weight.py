@@ -0,0 +1,46 @@
+from .util import records_dataframe
+from ._base import FitbitApiClass
+from .. import schema
+
+
+class BodyWeight(FitbitApiClass):
+    MAX_RANGE_DAYS = 31
+    SCHEMA = schema.BODY_WEIGHT_SCHEMA
+
+    COLUMNS = {
+        "date": "date",
+        "bmi": "bmi",
+        "fat": "fat",
+        "log_id": "logId",
+        "source": "source",
+        "weight": "weight",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe(json_dict.get("weight", []), self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date, end_date=None):
+        if end_date:
+            return f"/1/user/{user}/body/log/weight/date/{date}/{end_date}.json"
+        return f"/1/user/{user}/body/log/weight/date/{date}.json"
+
+
+if __name__ == "__main__":
+    json_dict = {
+        "weight": [
+            {
+                "bmi": 23.57,
+                "date": "2019-03-01",
+                "fat": 14.5,
+                "logId": 1553067000000,
+                "source": "Aria",
+                "time": "07:30:00",
+                "weight": 73
+            }
+        ]
+    }
+
+    print(BodyWeight(json_dict).dataframe)
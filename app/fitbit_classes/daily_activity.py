@@ -0,0 +1,134 @@
+import pandas as pd
+from .util import records_dataframe
+from ._base import FitbitApiClass
+from .. import schema
+
+
+class DailyActivitySummary(FitbitApiClass):
+    SCHEMA = schema.ACTIVITY_SUMMARY_SCHEMA
+
+    COLUMNS = {
+        "activity_score": "activeScore",
+        "activity_calories": "activityCalories",
+        "calories_bmr": "caloriesBMR",
+        "calories_out": "caloriesOut",
+        "elevation": "elevation",
+        "fairly_active_minutes": "fairlyActiveMinutes",
+        "floors": "floors",
+        "lightly_active_minutes": "lightlyActiveMinutes",
+        "marginal_calories": "marginalCalories",
+        "resting_heart_rate": "restingHeartRate",
+        "sedentary_minutes": "sedentaryMinutes",
+        "very_active_minutes": "veryActiveMinutes",
+        "steps": "steps",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe([json_dict.get("summary", {})], self.COLUMNS)
+        # fitbit reports elevation with decimals, the table stores whole units
+        self._df["elevation"] = self._df["elevation"].astype(float).round()
+
+    @classmethod
+    def url(cls, user, date):
+        return f"/1/user/{user}/activities/date/{date}.json"
+
+
+class ActivityLogs(FitbitApiClass):
+    SCHEMA = schema.ACTIVITY_LOGS_SCHEMA
+
+    COLUMNS = {
+        "activity_id": "activityId",
+        "activity_parent_id": "activityParentId",
+        "activity_parent_name": "activityParentName",
+        "calories": "calories",
+        "description": "description",
+        "distance": "distance",
+        "duration": "duration",
+        "has_active_zone_minutes": "hasActiveZoneMinutes",
+        "has_start_time": "hasStartTime",
+        "is_favorite": "isFavorite",
+        "log_id": "logId",
+        "name": "name",
+        "start_datetime": "startDate",
+        "steps": "steps",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        activities = json_dict.get("activities", [])
+        self._df = records_dataframe(activities, self.COLUMNS)
+        self._df["start_datetime"] = pd.to_datetime(
+            [f"{activity.get('startDate')} {activity.get('startTime', '00:00')}" for activity in activities]
+        )
+
+    @classmethod
+    def url(cls, user, date):
+        return DailyActivitySummary.url(user, date)
+
+
+class ActivityGoals(FitbitApiClass):
+    SCHEMA = schema.ACTIVITY_GOALS_SCHEMA
+
+    COLUMNS = {
+        "active_minutes": "activeMinutes",
+        "calories_out": "caloriesOut",
+        "distance": "distance",
+        "floors": "floors",
+        "steps": "steps",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe([json_dict.get("goals", {})], self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date=None):
+        return f"/1/user/{user}/activities/goals/daily.json"
+
+
+if __name__ == "__main__":
+    json_dict = {
+        "activities": [
+            {
+                "activityId": 90009,
+                "activityParentId": 90009,
+                "activityParentName": "Run",
+                "calories": 364,
+                "description": "Running - 5 mph (12 min/mile)",
+                "distance": 3.1,
+                "duration": 1800000,
+                "hasActiveZoneMinutes": True,
+                "hasStartTime": True,
+                "isFavorite": False,
+                "logId": 21985672012,
+                "name": "Run",
+                "startDate": "2019-03-01",
+                "startTime": "07:15",
+                "steps": 4012
+            }
+        ],
+        "goals": {"activeMinutes": 30, "caloriesOut": 2826, "distance": 8.05, "floors": 10, "steps": 10000},
+        "summary": {
+            "activeScore": -1,
+            "activityCalories": 1381,
+            "caloriesBMR": 1762,
+            "caloriesOut": 2933,
+            "elevation": 30.48,
+            "fairlyActiveMinutes": 29,
+            "floors": 10,
+            "lightlyActiveMinutes": 233,
+            "marginalCalories": 804,
+            "restingHeartRate": 64,
+            "sedentaryMinutes": 703,
+            "steps": 12014,
+            "veryActiveMinutes": 33
+        }
+    }
+
+    print(DailyActivitySummary(json_dict).dataframe)
+    print(ActivityLogs(json_dict).dataframe)
+    print(ActivityGoals(json_dict).dataframe)
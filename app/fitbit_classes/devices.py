@@ -0,0 +1,42 @@
+import pandas as pd
+from .util import records_dataframe
+from ._base import FitbitApiClass
+from .. import schema
+
+
+class Devices(FitbitApiClass):
+    SCHEMA = schema.DEVICES_SCHEMA
+
+    COLUMNS = {
+        "battery": "battery",
+        "battery_level": "batteryLevel",
+        "device_version": "deviceVersion",
+        "last_sync_time": "lastSyncTime",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe(json_dict, self.COLUMNS)
+        self._df["last_sync_time"] = pd.to_datetime(self._df["last_sync_time"])
+
+    @classmethod
+    def url(cls, user, date=None):
+        return f"/1/user/{user}/devices.json"
+
+
+if __name__ == "__main__":
+    json_dict = [
+        {
+            "battery": "High",
+            "batteryLevel": 95,
+            "deviceVersion": "Charge 4",
+            "features": [],
+            "id": "1234567890",
+            "lastSyncTime": "2019-03-01T06:22:16.000",
+            "mac": "0123456789AB",
+            "type": "TRACKER"
+        }
+    ]
+
+    print(Devices(json_dict).dataframe)
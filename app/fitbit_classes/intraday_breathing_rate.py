@@ -1,19 +1,16 @@
 import pandas as pd
 from .util import normalize
 from ._base import FitbitSummary, FitbitIntraday
+from .. import schema
 
 
 class BreathingRateSummary(FitbitSummary):
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
-        br = json_dict["br"]
-        if len(br) > 1:
-            raise RuntimeError(f"More than one date specified in {json_dict}")
-        br = br[0]
-        value = br["value"]
-        self._date = br['dateTime']
-        self._df = pd.DataFrame([pd.to_datetime(self._date)], columns=["time"])
+        dates = [br['dateTime'] for br in json_dict.get("br", [])]
+        self._date = dates[0] if dates else None
+        self._df = pd.DataFrame(pd.to_datetime(dates), columns=["time"])
 
     @classmethod
     def url(cls, user, date):
@@ -21,43 +18,48 @@ class BreathingRateSummary(FitbitSummary):
 
 
 class BreathingRateIntraday(FitbitIntraday):
+    MAX_RANGE_DAYS = 30
+    SCHEMA = schema.INTRADAY_BREATHING_RATE_SCHEMA
+
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
-        br = json_dict["br"]
-        if len(br) > 1:
-            raise RuntimeError(f"More than one date specified in {json_dict}")
-        br = br[0]
-        values = br["value"]
-
         # The summary for an intraday call is a bit different than that for an actual summary call.  So fake a summary
         # call
         faked_json_dict = {
             "br": [
                 {
                     "value": {
-                        "breathingRate": values["fullSleepSummary"]["breathingRate"]
+                        "breathingRate": br["value"]["fullSleepSummary"]["breathingRate"]
                     },
                     "dateTime": br["dateTime"]
                 }
+                for br in json_dict.get("br", [])
             ]
         }
         self._summary = BreathingRateSummary(faked_json_dict)
 
-        self._df = pd.json_normalize(values, meta="breathingRate")
-        self._df = pd.melt(self._df, var_name="stage")
-        self._df.replace(to_replace={
-            "deepSleepSummary.breathingRate": "deep",
-            "remSleepSummary.breathingRate": "rem",
-            "fullSleepSummary.breathingRate": "full",
-            "lightSleepSummary.breathingRate": "light"}, inplace=True)
-        self._df.rename(columns={"value": "rate"}, inplace=True)
-        self._df = normalize(self._df, self._summary.date, "00:00:00")
+        day_dfs = []
+        for br in json_dict.get("br", []):
+            df = pd.json_normalize(br["value"], meta="breathingRate")
+            df = pd.melt(df, var_name="stage")
+            df.replace(to_replace={
+                "deepSleepSummary.breathingRate": "deep",
+                "remSleepSummary.breathingRate": "rem",
+                "fullSleepSummary.breathingRate": "full",
+                "lightSleepSummary.breathingRate": "light"}, inplace=True)
+            df.rename(columns={"value": "rate"}, inplace=True)
+            day_dfs.append(normalize(df, br["dateTime"], "00:00:00"))
+        if not day_dfs:
+            self._df = pd.DataFrame(columns=["stage", "rate", "time"])
+            return
+        self._df = pd.concat(day_dfs, ignore_index=True)
 
     @classmethod
-    def url(cls, user, date, resolution="1d"):
-        return_val = "1/user/{user}/br/date/{date}.json".format(user=user,
-                                                                date=date)
+    def url(cls, user, date, end_date=None):
+        if end_date:
+            return f"/1/user/{user}/br/date/{date}/{end_date}/all.json"
+        return_val = f"/1/user/{user}/br/date/{date}/all.json"
         return return_val
 
 
@@ -1,8 +1,10 @@
 from ._intraday_activity import ActivityIntraday
+from .. import schema
 
 
 class CaloriesIntraday(ActivityIntraday):
     ACTIVITY_TYPE = "calories"
+    SCHEMA = schema.INTRADAY_CALORIES_SCHEMA
 
     def __init__(self, json_dict):
         super().__init__(json_dict)
@@ -1,8 +1,10 @@
 from ._intraday_activity import ActivityIntraday
+from .. import schema
 
 
 class DistanceIntraday(ActivityIntraday):
     ACTIVITY_TYPE = "distance"
+    SCHEMA = schema.INTRADAY_DISTANCE_SCHEMA
 
     def __init__(self, json_dict):
         super().__init__(json_dict)
@@ -1,8 +1,10 @@
 from ._intraday_activity import ActivityIntraday
+from .. import schema
 
 
 class ElevationIntraday(ActivityIntraday):
     ACTIVITY_TYPE = "elevation"
+    SCHEMA = schema.INTRADAY_ELEVATION_SCHEMA
 
     def __init__(self, json_dict):
         super().__init__(json_dict)
@@ -1,8 +1,10 @@
 from ._intraday_activity import ActivityIntraday
+from .. import schema
 
 
 class FloorsIntraday(ActivityIntraday):
     ACTIVITY_TYPE = "floors"
+    SCHEMA = schema.INTRADAY_FLOORS_SCHEMA
 
     def __init__(self, json_dict):
         super().__init__(json_dict)
@@ -1,6 +1,7 @@
 import pandas as pd
-from . util import normalize
+from . util import normalize, intraday_dataframe
 from . _base import FitbitSummary, FitbitIntraday
+from .. import schema
 
 
 class HeartRateSummary(FitbitSummary):
@@ -17,7 +18,8 @@ class HeartRateSummary(FitbitSummary):
         self._date = activities_heart["dateTime"]
 
         zones = activities_heart["value"]
-        self._resting_heart_rate = zones["restingHeartRate"]
+        # not given for days without data
+        self._resting_heart_rate = zones.get("restingHeartRate")
 
         custom_zones_df = pd.json_normalize(zones["customHeartRateZones"])
         custom_zones_df = normalize(custom_zones_df, self._date, "00:00:00")
@@ -35,14 +37,14 @@ class HeartRateSummary(FitbitSummary):
 
 
 class HeartRateIntraday(FitbitIntraday):
+    SCHEMA = schema.INTRADAY_HEART_RATE_SCHEMA
+
     def __init__(self, json_dict):
         super().__init__(json_dict)
         self._summary = HeartRateSummary(json_dict)
 
         activities_heart_intraday = json_dict["activities-heart-intraday"]
-        heart_rate_intraday = activities_heart_intraday["dataset"]
-        heart_rate_intraday_df = pd.json_normalize(heart_rate_intraday)
-        self._df = normalize(heart_rate_intraday_df, self._summary.date, heart_rate_intraday_df["time"])
+        self._df = intraday_dataframe(self._summary.date, activities_heart_intraday["dataset"])
         self._df.rename(columns={"value": "heart_rate"}, inplace=True)
         self._df["dataset_interval"] = activities_heart_intraday["datasetInterval"]
         self._df["dataset_type"] = activities_heart_intraday["datasetType"]
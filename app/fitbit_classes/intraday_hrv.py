@@ -1,17 +1,16 @@
 import pandas as pd
 from . _base import FitbitSummary, FitbitIntraday
+from .. import schema
 
 
 class HrvSummary(FitbitSummary):
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
-        hrv = json_dict["hrv"]
-        if len(hrv) > 1:
-            raise RuntimeError(f"More than one date specified in {json_dict}")
-        hrv = hrv[0]
-        self._date = hrv['dateTime']
-        self._df = pd.DataFrame([pd.to_datetime(self._date)], columns=["time"])
+        # days without data are left out, a range without any is empty
+        dates = [hrv['dateTime'] for hrv in json_dict.get("hrv", [])]
+        self._date = dates[0] if dates else None
+        self._df = pd.DataFrame(pd.to_datetime(dates), columns=["time"])
 
     @classmethod
     def url(cls, user, date):
@@ -19,16 +18,18 @@ class HrvSummary(FitbitSummary):
 
 
 class HrvIntraday(FitbitIntraday):
+    MAX_RANGE_DAYS = 30
+    SCHEMA = schema.INTRADAY_HRV_SCHEMA
+
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
         self._summary = HrvSummary(json_dict)
 
-        hrv = json_dict["hrv"]
-        if len(hrv) > 1:
-            raise RuntimeError(f"More than one date specified in {json_dict}")
-        hrv = hrv[0]
-        minutes = hrv['minutes']
+        minutes = [minute for hrv in json_dict.get("hrv", []) for minute in hrv.get('minutes', [])]
+        if not minutes:
+            self._df = pd.DataFrame(columns=["time", "rmssd", "coverage", "hf", "lf"])
+            return
         self._df = pd.json_normalize(minutes, None, ["value", "minute"])
         self._df["minute"] = pd.to_datetime(self._df["minute"])
         self._df.rename(columns={"minute": "time"}, inplace=True)
@@ -36,7 +37,9 @@ class HrvIntraday(FitbitIntraday):
         self._df.rename(columns=new_column_names, inplace=True)
 
     @classmethod
-    def url(cls, user, date):
+    def url(cls, user, date, end_date=None):
+        if end_date:
+            return f"/1/user/{user}/hrv/date/{date}/{end_date}/all.json"
         return_val = f"/1/user/{user}/hrv/date/{date}/all.json"
         return return_val
 
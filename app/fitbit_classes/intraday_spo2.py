@@ -1,13 +1,18 @@
 import pandas as pd
 from . _base import FitbitSummary, FitbitIntraday
+from .. import schema
 
 
 class Spo2Summary(FitbitSummary):
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
-        self._date = json_dict['dateTime']
-        self._df = pd.DataFrame([pd.to_datetime(self._date)], columns=["time"])
+        # a date range request returns a list with one entry per day, and
+        # a day without data is an empty dict or list
+        days = json_dict if isinstance(json_dict, list) else [json_dict]
+        dates = [day['dateTime'] for day in days if day and 'dateTime' in day]
+        self._date = dates[0] if dates else None
+        self._df = pd.DataFrame(pd.to_datetime(dates), columns=["time"])
 
     @classmethod
     def url(cls, user, date):
@@ -15,18 +20,27 @@ class Spo2Summary(FitbitSummary):
 
 
 class Spo2Intraday(FitbitIntraday):
+    MAX_RANGE_DAYS = 30
+    SCHEMA = schema.INTRADAY_SPO2_SCHEMA
+
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
         self._summary = Spo2Summary(json_dict)
 
-        minutes = json_dict['minutes']
+        days = json_dict if isinstance(json_dict, list) else [json_dict]
+        minutes = [minute for day in days if day for minute in day.get('minutes', [])]
+        if not minutes:
+            self._df = pd.DataFrame(columns=["time", "spo2"])
+            return
         self._df = pd.json_normalize(minutes, None, ["value", "minute"])
         self._df["minute"] = pd.to_datetime(self._df["minute"])
         self._df.rename(columns={"minute": "time", "value": "spo2"}, inplace=True)
 
     @classmethod
-    def url(cls, user, date):
+    def url(cls, user, date, end_date=None):
+        if end_date:
+            return f"/1/user/{user}/spo2/date/{date}/{end_date}/all.json"
         return_val = f"/1/user/{user}/spo2/date/{date}/all.json"
         return return_val
 
@@ -1,8 +1,10 @@
 from ._intraday_activity import ActivityIntraday
+from .. import schema
 
 
 class StepsIntraday(ActivityIntraday):
     ACTIVITY_TYPE = "steps"
+    SCHEMA = schema.INTRADAY_STEPS_SCHEMA
 
     def __init__(self, json_dict):
         super().__init__(json_dict)
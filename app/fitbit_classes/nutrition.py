@@ -0,0 +1,111 @@
+from .util import records_dataframe
+from ._base import FitbitApiClass
+from .. import schema
+
+
+class NutritionSummary(FitbitApiClass):
+    SCHEMA = schema.NUTRITION_SUMMARY_SCHEMA
+
+    COLUMNS = {
+        "calories": "calories",
+        "carbs": "carbs",
+        "fat": "fat",
+        "fiber": "fiber",
+        "protein": "protein",
+        "sodium": "sodium",
+        "water": "water",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe([json_dict.get("summary", {})], self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date):
+        return f"/1/user/{user}/foods/log/date/{date}.json"
+
+
+class NutritionLogs(FitbitApiClass):
+    SCHEMA = schema.NUTRITION_LOGS_SCHEMA
+
+    COLUMNS = {
+        "is_favorite": "isFavorite",
+        "log_date": "logDate",
+        "log_id": "logId",
+        "logged_food_access_level": "loggedFood.accessLevel",
+        "logged_food_amount": "loggedFood.amount",
+        "logged_food_brand": "loggedFood.brand",
+        "logged_food_calories": "loggedFood.calories",
+        "logged_food_food_id": "loggedFood.foodId",
+        "logged_food_meal_type_id": "loggedFood.mealTypeId",
+        "logged_food_name": "loggedFood.name",
+        "logged_food_unit_name": "loggedFood.unit.name",
+        "logged_food_unit_plural": "loggedFood.unit.plural",
+        "nutritional_values_calories": "nutritionalValues.calories",
+        "nutritional_values_carbs": "nutritionalValues.carbs",
+        "nutritional_values_fat": "nutritionalValues.fat",
+        "nutritional_values_fiber": "nutritionalValues.fiber",
+        "nutritional_values_protein": "nutritionalValues.protein",
+        "nutritional_values_sodium": "nutritionalValues.sodium",
+        "logged_food_locale": "loggedFood.locale",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe(json_dict.get("foods", []), self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date):
+        return NutritionSummary.url(user, date)
+
+
+class NutritionGoals(FitbitApiClass):
+    SCHEMA = schema.NUTRITION_GOALS_SCHEMA
+
+    COLUMNS = {"calories": "calories"}
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe([json_dict.get("goals", {})], self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date=None):
+        return f"/1/user/{user}/foods/log/goal.json"
+
+
+if __name__ == "__main__":
+    json_dict = {
+        "foods": [
+            {
+                "isFavorite": False,
+                "logDate": "2019-03-01",
+                "logId": 17875417225,
+                "loggedFood": {
+                    "accessLevel": "PUBLIC",
+                    "amount": 1,
+                    "brand": "",
+                    "calories": 105,
+                    "foodId": 81295,
+                    "locale": "en_US",
+                    "mealTypeId": 1,
+                    "name": "Banana",
+                    "unit": {"id": 226, "name": "oz", "plural": "oz"},
+                    "units": [226]
+                },
+                "nutritionalValues": {
+                    "calories": 105, "carbs": 27, "fat": 0.39, "fiber": 3.1, "protein": 1.29, "sodium": 1
+                }
+            }
+        ],
+        "goals": {"calories": 2286},
+        "summary": {
+            "calories": 105, "carbs": 27, "fat": 0.39, "fiber": 3.1, "protein": 1.29, "sodium": 1, "water": 0
+        }
+    }
+
+    print(NutritionSummary(json_dict).dataframe)
+    print(NutritionLogs(json_dict).dataframe)
+    print(NutritionGoals(json_dict).dataframe)
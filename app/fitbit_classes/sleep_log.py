@@ -1,7 +1,7 @@
 import pandas as pd
-from skimpy import clean_columns
-from .util import normalize
+from .util import normalize, clean_names, compact
 from ._base import FitbitSummary, FitbitIntraday
+from .. import schema
 
 
 class SleepSummary(FitbitSummary):
@@ -9,13 +9,11 @@ class SleepSummary(FitbitSummary):
     def __init__(self, json_dict):
         super().__init__(json_dict)
 
-        sleep = json_dict["sleep"]
-        if len(sleep) > 1:
-            raise RuntimeError(f"More than one date specified in {json_dict}")
-        sleep = sleep[0]
-        self._date = sleep["dateOfSleep"]
+        sleeps = json_dict.get("sleep", [])
+        self._date = sleeps[0]["dateOfSleep"] if sleeps else None
 
-        summary = json_dict["summary"]
+        # date range requests do not include a summary
+        summary = json_dict.get("summary", {})
 
         df = pd.json_normalize(summary)
         df.rename(columns={
@@ -24,7 +22,7 @@ class SleepSummary(FitbitSummary):
             "stages.rem": "rem_minutes",
             "stages.wake": "wake_minutes"
         }, inplace=True)
-        self._df = normalize(df, self._date, "00:00:00")
+        self._df = normalize(df, self._date, "00:00:00") if self._date else clean_names(df)
 
     @classmethod
     def url(cls, user, date):
@@ -33,6 +31,10 @@ class SleepSummary(FitbitSummary):
 
 class SleepLog(FitbitIntraday):
 
+    MAX_RANGE_DAYS = 100
+    SCHEMA = schema.SLEEP_STAGES_SCHEMA
+    META_SCHEMA = schema.SLEEP_RECORDS_SCHEMA
+
     LEVELS = [
         "deep",
         "light",
@@ -63,18 +65,23 @@ class SleepLog(FitbitIntraday):
 
         self._summary = SleepSummary(json_dict)
 
-        sleeps = json_dict["sleep"]
+        sleeps = json_dict.get("sleep", [])
+        if not sleeps:
+            self._meta_df = pd.DataFrame(
+                columns=[field["name"] for field in self.META_SCHEMA if field["name"] != "id"])
+            self._df = pd.DataFrame(columns=["time", "level", "seconds", "log_id"])
+            return
 
         meta_dfs = []
         stage_dfs = []
         for sleep in sleeps:
             meta_dict = {key: sleep[key] for key in self.META_COLS}
-            meta_df = clean_columns(pd.json_normalize(meta_dict))
+            meta_df = clean_names(pd.json_normalize(meta_dict))
             meta_df["end_time"] = pd.to_datetime(meta_df["end_time"])
             meta_df["start_time"] = pd.to_datetime(meta_df["start_time"])
 
             summary_df = pd.json_normalize(sleep["levels"]["summary"])
-            summary_df = clean_columns(summary_df)
+            summary_df = clean_names(summary_df)
             meta_df = meta_df.join(summary_df)
             meta_dfs.append(meta_df)
 
@@ -89,10 +96,12 @@ class SleepLog(FitbitIntraday):
 
     @property
     def meta_dataframe(self):
-        return self._meta_df
+        return compact(self._meta_df, self.META_SCHEMA)
 
     @staticmethod
-    def url(user, date):
+    def url(user, date, end_date=None):
+        if end_date:
+            return f"/1.2/user/{user}/sleep/date/{date}/{end_date}.json"
         return_val = "/1.2/user/{user}/sleep/date/{date}.json".format(user=user,
                                                                       date=date)
         return return_val
@@ -0,0 +1,44 @@
+from .util import records_dataframe
+from ._base import FitbitApiClass
+from .. import schema
+
+
+class Social(FitbitApiClass):
+    SCHEMA = schema.SOCIAL_SCHEMA
+
+    COLUMNS = {
+        "friend_id": "id",
+        "type": "type",
+        "attributes_name": "attributes.name",
+        "attributes_friend": "attributes.friend",
+        "attributes_avatar": "attributes.avatar",
+        "attributes_child": "attributes.child",
+    }
+
+    def __init__(self, json_dict):
+        super().__init__(json_dict)
+
+        self._df = records_dataframe(json_dict.get("data", []), self.COLUMNS)
+
+    @classmethod
+    def url(cls, user, date=None):
+        return f"/1.1/user/{user}/friends.json"
+
+
+if __name__ == "__main__":
+    json_dict = {
+        "data": [
+            {
+                "type": "person",
+                "id": "ABCDEF",
+                "attributes": {
+                    "name": "Jane D.",
+                    "friend": True,
+                    "avatar": "https://static0.fitbit.com/images/profile/defaultProfile_100.png",
+                    "child": False
+                }
+            }
+        ]
+    }
+
+    print(Social(json_dict).dataframe)
@@ -1,7 +1,145 @@
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
 from skimpy import clean_columns
 
+# field names found in fitbit responses.  their cleaned names are computed
+# once at import, so cleaning column names only calls clean_columns for
+# names not listed here.
+FITBIT_COLUMNS = [
+    "time", "value", "level", "mets", "seconds", "dateTime", "stage", "rate",
+    "heart_rate", "dataset_interval", "dataset_type",
+    "caloriesOut", "max", "min", "minutes", "name",
+    "dateOfSleep", "duration", "efficiency", "endTime", "infoCode", "isMainSleep",
+    "logId", "log_id", "minutesAfterWakeup", "minutesAsleep", "minutesAwake",
+    "minutesToFallAsleep", "logType", "startTime", "timeInBed", "type",
+    "totalMinutesAsleep", "totalSleepRecords", "totalTimeInBed",
+    "deep_minutes", "light_minutes", "rem_minutes", "wake_minutes",
+    "user.age", "user.city", "user.state", "user.country", "user.dateOfBirth",
+    "user.displayName", "user.encodedId", "user.fullName", "user.gender",
+    "user.height", "user.heightUnit", "user.timezone", "id", "date", "surgery_date",
+] + [
+    f"{level}.{field}"
+    for level in ["deep", "light", "rem", "wake", "asleep", "awake", "restless"]
+    for field in ["count", "minutes", "thirtyDayAvgMinutes"]
+]
+
+
+def _clean_column_names(columns):
+    return tuple(clean_columns(pd.DataFrame(columns=list(columns))).columns)
+
+
+_CLEAN_NAMES = {column: _clean_column_names([column])[0] for column in FITBIT_COLUMNS}
+
+
+@lru_cache(maxsize=1024)
+def clean_column_names(columns):
+    """the names clean_columns would give a tuple of column names"""
+    unseen = [column for column in columns if column not in _CLEAN_NAMES]
+    cleaned = dict(zip(unseen, _clean_column_names(unseen))) if unseen else {}
+    names = tuple(_CLEAN_NAMES[column] if column in _CLEAN_NAMES else cleaned[column] for column in columns)
+    if len(set(names)) != len(names):
+        # clean_columns numbers duplicates, which depends on the whole tuple
+        names = _clean_column_names(columns)
+    return names
+
+
+def clean_names(df):
+    """same as clean_columns(df), using the cached names"""
+    columns = tuple(df.columns)
+    names = clean_column_names(columns)
+    if names == columns:
+        return df
+    return df.set_axis(names, axis=1)
+
+
 def normalize(df, date, time):
     df["time"] = pd.to_datetime(date + " " + time)
-    df = clean_columns(df)
+    df = clean_names(df)
     return df
+
+
+def _seconds_of_day(times):
+    """seconds since midnight for a list of "HH:MM:SS" strings, or None if any is malformed"""
+    if not all(len(t) == 8 for t in times):
+        return None
+    digits = np.frombuffer("".join(times).encode("ascii"), dtype=np.uint8).reshape(-1, 8)
+    digits = digits[:, [0, 1, 3, 4, 6, 7]].astype(np.int64) - ord("0")
+    if ((digits < 0) | (digits > 9)).any():
+        return None
+    return (digits[:, 0] * 10 + digits[:, 1]) * 3600 \
+        + (digits[:, 2] * 10 + digits[:, 3]) * 60 \
+        + digits[:, 4] * 10 + digits[:, 5]
+
+
+def intraday_dataframe(date, dataset):
+    """dataframe for an intraday `dataset` list, as normalize(pd.json_normalize(dataset), date, time) builds it
+
+    the columns are built directly from the records, and `time` is computed
+    as `date` plus the offset of each record into the day, instead of parsing
+    every timestamp.  falls back to the slow path for anything unusual.
+    an empty `dataset`, a day without data, gives an empty dataframe with
+    the `time` and `value` columns.
+    """
+    if not dataset:
+        return pd.DataFrame({"time": pd.to_datetime([]), "value": []})
+    columns = list(dataset[0]) if dataset else []
+    seconds = _seconds_of_day([record["time"] for record in dataset]) if "time" in columns else None
+    if seconds is None:
+        df = pd.json_normalize(dataset)
+        return normalize(df, date, df["time"])
+
+    data = {}
+    for column in columns:
+        if column == "time":
+            times = np.datetime64(date, "s") + seconds.astype("timedelta64[s]")
+            data[column] = times.astype(pd.to_datetime([date]).dtype)
+            continue
+        try:
+            values = np.array([record[column] for record in dataset])
+        except KeyError:
+            values = None
+        if values is None or values.dtype == object:
+            df = pd.json_normalize(dataset)
+            return normalize(df, date, df["time"])
+        data[column] = values
+
+    return clean_names(pd.DataFrame(data))
+
+
+def compact(df, table_schema):
+    """``df`` with the smallest dtypes for the types its columns have in ``table_schema``
+
+    STRING columns become categories and INTEGER columns the smallest
+    integer dtype holding their values.  columns with other types, not
+    declared, or integers with missing values are left as they are.
+    """
+    types = {field["name"]: field["type"].upper() for field in table_schema}
+    for column in df.columns:
+        field_type = types.get(column)
+        if field_type == "STRING" and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+        elif field_type == "INTEGER" and pd.api.types.is_integer_dtype(df[column].dtype):
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+
+def _field(record, path):
+    for key in path.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def records_dataframe(records, columns):
+    """dataframe with a row per record, and a column per ``{name: "dotted.path"}`` of ``columns``
+
+    fields missing from a record are None, so every column is there even
+    for an empty list of records.
+    """
+    return pd.DataFrame(
+        [[_field(record, path) for path in columns.values()] for record in records],
+        columns=list(columns),
+    )
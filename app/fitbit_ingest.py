@@ -22,10 +22,53 @@ run on a schedule.
 Routes:
 
     /ingest: test route to test if the blueprint is correctly registered
-    /download: download everything for the day to files
+    /refresh_tokens: refresh the tokens about to expire, run it shortly
+                     before the ingestion routes
+    /download: download everything for the day into the raw archive
+    /dispatch: queue the ingestion of every resource as tasks, see
+               ``work_queue``
+    /work: process one queued task
+    /replay: rebuild the tables for the given days from the raw archive,
+             without calling fitbit
+    /metrics: timings and counters of the ingestion, for prometheus, see
+              ``metrics``
+    /export: stream the parsed rows of one user for the given days, as
+             newline delimited json or arrow, built from the raw archive
+             or fitbit
     /fitbit_sleep_scope:  sleep data
     /fitbit_intraday_scope: includes intraday hrv, spo2, breathing_rate, steps, floors, distance,
                              elevation, calories, heart_rate
+    /fitbit_daily_scope: daily activity summary and logs, nutrition summary
+                         and logs, body weight, and the snapshots of devices,
+                         goals, badges and friends
+
+    all routes accept the following query parameters:
+
+        * `date`: day to ingest, defaults to yesterday.
+        * `start`, `end`: ingest every day from `start` to `end` inclusive,
+            instead of a single `date`.  sleep, hrv, spo2 and breathing rate
+            are fetched with fitbit's date range endpoints.
+        * `user`: ingest only this user.
+        * `resume`: for the sleep, intraday, daily and dispatch routes, id of an
+            earlier run to finish, through the route that started it.  the
+            run's days are fetched again for its users, except for the units
+            the run ledger lists as loaded.
+
+    every call of the sleep, intraday, daily and dispatch routes is a run, with an
+    id returned in the response.  the status, row count, latency and error
+    of each user, resource and range of days fetched by the run are
+    recorded in firestore, see ``firestore_storage.RunLedger``.  the time
+    the run spent fetching tokens, calling fitbit, decoding, parsing and
+    loading is logged when it ends, see ``metrics``.
+
+    when neither `date` nor `start` is given, the sleep, intraday and daily
+    routes ingest incrementally: for each user and resource they fetch the days
+    after the last one ingested (its watermark) up to yesterday, or up to
+    the day before the user's device last synced if that is earlier.
+
+    the daily route also fetches the snapshot resources (devices, goals,
+    badges, friends) that were not fetched for a while, and only loads
+    them when the response changed since the last one loaded.
 
 Dependencies:
 
@@ -41,6 +84,24 @@ Configuration:
     * `GOOGLE_CLOUD_PROJECT`: gcp project where bigquery is available.
     * `GOOGLE_APPLICATION_CREDENTIALS`: points to a service account json.
     * `BIGQUERY_DATASET`: dataset to use to store user data.
+    * `INGEST_CONCURRENCY`: optional, maximum number of users ingested at
+        once (default 8).  can be overridden per call with `?concurrency=`.
+    * `RAW_ARCHIVE_URI`: optional, where to archive the raw responses, see
+        ``raw_archive``.  `/download` uses a local `raw_archive` directory if
+        this is not set.
+    * `INGEST_MAX_LOOKBACK_DAYS`: optional, the most days an incremental
+        run goes back for a user that has not synced for a while (default 30).
+    * `INGEST_ASYNC`: optional, if set `/fitbit_intraday_scope` fetches the
+        resources of each user concurrently, through one pool of
+        connections shared by all users (see ``fitbit_async``).
+    * `WORK_QUEUE`: optional, queue used by `/dispatch` and `/work`, see
+        ``work_queue``.
+    * `TOKEN_REFRESH_WINDOW`: optional, `/refresh_tokens` refreshes the
+        tokens expiring in the next this many seconds (default 3600).
+    * `EXPORT_CHUNK_ROWS`: optional, rows `/export` serializes at once
+        (default 10000).
+    * `DISPATCH_USERS_PER_TASK`: optional, users in each task queued by
+        `/dispatch` (default 50).
 
 Notes:
 
@@ -50,20 +111,33 @@ Notes:
 
 """
 
+import asyncio
+import hashlib
+import io
+import json
 import os
-from datetime import date, timedelta
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
 import logging
-import pickle
 
-import pandas_gbq
-from flask import Blueprint, request
-from flask_dance.contrib.fitbit import fitbit
-from skimpy import clean_columns
+import pyarrow as pa
+from flask import Blueprint, Response, abort, request, stream_with_context
 
-from .fitbit_auth import fitbit_bp
+from .bigquery_writer import ARROW_TYPES, BigQueryWriter
+from .fitbit_auth import fitbit_bp, run_ledger, snapshots, watermarks
+from .fitbit_async import AsyncFitbitClient
+from .fitbit_session import FitbitUserSession
 
-from . import schema
+from . import raw_archive
+from . import resources
 from . import fitbit_classes
+from . import fitbit_rate_limit
+from . import metrics
+from . import work_queue
+from .fitbit_classes.util import clean_names
 
 log = logging.getLogger(__name__)
 
@@ -74,8 +148,18 @@ if not bigquery_dataset_name:
     bigquery_dataset_name = "fitbit2"
 
 
-def _table_name(table: str) -> str:
-    return bigquery_dataset_name + "." + table
+ingest_concurrency = int(os.environ.get("INGEST_CONCURRENCY", 8))
+max_lookback_days = int(os.environ.get("INGEST_MAX_LOOKBACK_DAYS", 30))
+token_refresh_window = int(os.environ.get("TOKEN_REFRESH_WINDOW", 3600))
+ingest_async = bool(os.environ.get("INGEST_ASYNC"))
+export_chunk_rows = int(os.environ.get("EXPORT_CHUNK_ROWS", 10000))
+dispatch_users_per_task = int(os.environ.get("DISPATCH_USERS_PER_TASK", 50))
+
+# media type of each `/export` format
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
 
 
 def _normalize_response(df, column_list, email, date_pulled):
@@ -85,7 +169,7 @@ def _normalize_response(df, column_list, email, date_pulled):
     df = df.reindex(columns=column_list)
     df.insert(0, "id", email)
     df.insert(1, "date", date_pulled)
-    df = clean_columns(df)
+    df = clean_names(df)
     return df
 
 
@@ -95,154 +179,892 @@ def _date_pulled():
     return date_pulled.strftime("%Y-%m-%d")
 
 
+def _dates(request):
+    """first and last day requested with `date` or `start`/`end`, defaults to yesterday"""
+    start = request.args.get("start", request.args.get("date", _date_pulled()))
+    end = request.args.get("end", start)
+    try:
+        if date.fromisoformat(start) > date.fromisoformat(end):
+            abort(400, "start must not be after end")
+    except ValueError:
+        abort(400, "dates must be formatted as YYYY-MM-DD")
+
+    return start, end
+
+
+def _incremental(request):
+    """true when the caller did not ask for specific days"""
+    return not (request.args.get("date") or request.args.get("start"))
+
+
 def _process_request(request):
     project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
-    # if caller provided date as query params, use that otherwise use yesterday
-    date_pulled = request.args.get("date", _date_pulled())
-    user_list = fitbit_bp.storage.all_users()
-    if request.args.get("user") in user_list:
-        user_list = [request.args.get("user")]
+    # if caller provided dates as query params, use those otherwise use yesterday
+    start, end = _dates(request)
+
+    return project_id, start, end, _user_list(request.args.get("user"))
+
+
+def _user_list(user):
+    """``[user]`` if ``user`` has a token, otherwise every user"""
+    if user and fitbit_bp.storage.has_user(user):
+        return [user]
+    return fitbit_bp.storage.all_users()
+
+
+def _concurrency(request):
+    """number of users to ingest at once, from `?concurrency=` or the environment"""
+    try:
+        concurrency = int(request.args.get("concurrency", ingest_concurrency))
+    except ValueError:
+        concurrency = ingest_concurrency
+    return max(concurrency, 1)
+
 
-    return project_id, date_pulled, user_list
+def _user_session(user):
+    """create an oauth session bound to ``user``, see ``FitbitUserSession``"""
+    return FitbitUserSession(user, fitbit_bp)
 
 
-def _write_to_bq(bulk_df, table_name, project_id, table_schema):
-    if bulk_df.shape[0] > 0:
+def _for_each_user(user_list, concurrency, func, *args):
+    """call ``func(user, *args)`` for every user on a bounded thread pool
+
+    ``user_list`` may be a generator, users are read from it only as fast as
+    they are processed.  an exception raised for one user is logged and does
+    not stop the others.  returns ``{user: exception}`` for the users that
+    raised one.
+    """
+
+    def _finish(done):
+        for future in done:
+            user = futures.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                log.error("exception occurred while ingesting '%s': %s", user, e)
+                failed[user] = e
+
+    futures = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for user in user_list:
+            if len(futures) >= 2 * concurrency:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                _finish(done)
+            futures[executor.submit(func, user, *args)] = user
+
+        _finish(wait(futures).done)
+
+    return failed
+
+
+def _devices(session, run):
+    """getter of the user's ``/1/user/-/devices.json``, fetched on its first call only
+
+    an incremental run reads the last sync date from it, and the ``Devices``
+    snapshot loads the same response instead of fetching it again
+    """
+    fetched = []
+
+    def get():
+        if not fetched:
+            fetched.append(_fetch(session, fitbit_classes.Devices, fitbit_classes.Devices.url("-"), run))
+        return fetched[0]
+
+    return get
+
+
+def _last_sync_date(resp):
+    """day the user's devices last synced, from their devices.json ``resp``, or None if unknown"""
+    if resp.status_code != 200:
+        return None
+    sync_times = [device["lastSyncTime"] for device in resp.json() if device.get("lastSyncTime")]
+    return max(sync_times)[:10] if sync_times else None
+
+
+def _fetch_token(session, run):
+    """read the user's token, refreshing it if needed, so that is not timed as http"""
+    with metrics.span("token", timings=run.timings):
+        if session.token and session.expired:
+            session.refresh()
+
+
+def _fetch(session, class_type, url, run):
+    """get ``url`` for ``class_type``, timed and counted in the metrics"""
+    with metrics.span("http", class_type.__name__, run.timings):
+        resp = session.get(url)
+    metrics.RESPONSES.inc(resource=class_type.__name__, status=resp.status_code)
+    log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
+    return resp
+
+
+def _decode(resp, class_type, run):
+    with metrics.span("decode", class_type.__name__, run.timings):
+        return resp.json()
+
+
+class _IngestRun:
+    """days to ingest, and the watermarks to advance, for one route call
+
+    with explicit dates every user and resource gets the requested days.
+    in incremental mode the days come from the user's watermarks, and
+    ``commit`` advances them once the data has been loaded.
+
+    each fetch is recorded in the run ledger under ``run_id``, first as
+    "fetched" or "failed", then as "loaded" by ``commit``.  units listed in
+    ``completed`` were loaded by an earlier attempt of the run and are
+    skipped.
+    """
+
+    def __init__(self, start, end, incremental, run_id=None, completed=()):
+        self.start = start
+        self.end = end
+        self.incremental = incremental
+        self.run_id = run_id
+        self.completed = set(completed)
+        self._lock = threading.Lock()
+        self._ingested = []
+        self._snapshots = []
+        self._last_sync = {}
+        self.errors = []
+        self.timings = metrics.Timings()
+
+    def days(self, user, class_types, last_sync_date):
+        """{class: (first, last)} of the days to fetch for ``user``, skipping up to date classes
+
+        ``last_sync_date()`` returns the day the user's devices last synced,
+        it is only called in incremental mode.
+        """
+        if not self.incremental:
+            return {class_type: (self.start, self.end) for class_type in class_types}
+
+        end = date.fromisoformat(self.end)
+        if user not in self._last_sync:
+            self._last_sync[user] = last_sync_date()
+        last_sync = self._last_sync[user]
+        if last_sync:
+            end = min(end, date.fromisoformat(last_sync) - timedelta(days=1))
+
+        user_watermarks = watermarks.get(user)
+        days = {}
+        for class_type in class_types:
+            watermark = user_watermarks.get(class_type.__name__)
+            if watermark:
+                start = date.fromisoformat(watermark) + timedelta(days=1)
+                start = max(start, end - timedelta(days=max_lookback_days - 1))
+            else:
+                # nothing ingested yet, start with the most recent day
+                start = end
+            if start <= end:
+                days[class_type] = (start.isoformat(), end.isoformat())
+
+        return days
+
+    def skip(self, user, class_type, first):
+        """true if the days from ``first`` were already loaded by this run"""
+        return (user, class_type.__name__, first) in self.completed
+
+    def ingested(self, user, class_type, first, last, tables, rows, latency):
+        """record that ``class_type`` was fetched from ``first`` to ``last`` for ``user``, into ``tables``"""
+        with self._lock:
+            self._ingested.append((user, class_type.__name__, first, last, tables, rows, latency))
+        self._record({(user, class_type.__name__, first): {
+            "status": "fetched", "last": last, "rows": rows, "latency": latency,
+        }})
+
+    def snapshot(self, user, class_type, day, digest, tables):
+        """remember the digest of a snapshot response, saved by ``commit`` once ``tables`` are loaded"""
+        with self._lock:
+            self._snapshots.append((user, class_type.__name__, day, digest, tables))
+
+    def failed(self, user, class_type, first, last, reason, latency, retry=True):
+        """record a fetch that failed, and should make a queued task retry if ``retry``"""
+        if isinstance(reason, Exception):
+            error_class, error = type(reason).__name__, str(reason)
+        else:
+            error_class, error = f"HTTP {reason}", str(reason)
+
+        if retry:
+            with self._lock:
+                self.errors.append(f"{class_type.__name__} for '{user}': {error}")
+        self._record({(user, class_type.__name__, first): {
+            "status": "failed", "last": last, "latency": latency,
+            "error_class": error_class, "error": error,
+        }})
+
+    def commit(self, writer):
+        """mark what ``writer`` loaded in the ledger, and advance the watermarks"""
+        units = {}
+        updates = {}
+        for user, resource, first, last, tables, rows, latency in self._ingested:
+            failed_tables = writer.failed.intersection(tables)
+            if failed_tables:
+                units[(user, resource, first)] = {
+                    "status": "failed", "error_class": "LoadError",
+                    "error": "failed to load " + ", ".join(sorted(failed_tables)),
+                }
+            else:
+                units[(user, resource, first)] = {"status": "loaded"}
+                updates.setdefault(user, {})[resource] = last
+
+        self._record(units)
+        loaded = sum(unit["status"] == "loaded" for unit in units.values())
+        metrics.UNITS.inc(loaded, status="loaded")
+        metrics.UNITS.inc(len(units) - loaded, status="load_failed")
+        metrics.UNITS.inc(len(self.errors), status="fetch_failed")
+        log.info("run %s: %d units loaded, %d failed to load, %d failed to fetch",
+                 self.run_id, loaded, len(units) - loaded, len(self.errors))
+        log.info("run %s: time per stage: %s", self.run_id, self.timings.summary())
+
+        for user, resource, day, digest, tables in self._snapshots:
+            if writer.failed.intersection(tables):
+                continue
+            try:
+                snapshots.set(user, {resource: {"date": day, "digest": digest}})
+            except Exception as e:
+                log.error("exception occurred while saving the %s snapshot of '%s': %s", resource, user, e)
+
+        if not self.incremental:
+            return
+
+        for user, user_watermarks in updates.items():
+            try:
+                watermarks.set(user, user_watermarks)
+            except Exception as e:
+                log.error("exception occurred while saving watermarks for '%s': %s", user, e)
+
+    def _record(self, units):
+        if not (self.run_id and units):
+            return
         try:
-            pandas_gbq.to_gbq(
-                dataframe=bulk_df,
-                destination_table=_table_name(table_name),
-                project_id=project_id,
-                if_exists="append",
-                table_schema=table_schema
-            )
+            run_ledger.record(self.run_id, units)
         except Exception as e:
-            log.error("exception occurred: %s", str(e))
+            log.error("exception occurred while recording run %s: %s", self.run_id, e)
+
+
+def _start_run(request, start, end, user_list):
+    """``(_IngestRun, users)`` for a route call, a new run or the run named by `?resume=`
+
+    a resumed run ingests the users of the original call, `?user=` if it
+    was given, and must be resumed through the route that started it.
+    """
+    resume = request.args.get("resume")
+    if resume:
+        params = run_ledger.run(resume)
+        if params is None:
+            abort(404, f"unknown run '{resume}'")
+        if params.get("route", request.path) != request.path:
+            abort(400, f"run '{resume}' was started by {params['route']}")
+        completed = [
+            (unit["user"], unit["resource"], unit["date"])
+            for unit in run_ledger.units(resume)
+            if unit.get("status") == "loaded"
+        ]
+        log.info("resuming run %s, %d units already loaded", resume, len(completed))
+        run = _IngestRun(params["start"], params["end"], params["incremental"], resume, completed)
+        return run, _user_list(params.get("user"))
+
+    metrics.RUNS.inc(route=request.path)
+    run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+    run = _IngestRun(start, end, _incremental(request), run_id)
+    try:
+        run_ledger.start(run_id, {
+            "route": request.path, "user": request.args.get("user"),
+            "start": start, "end": end, "incremental": run.incremental,
+        })
+    except Exception as e:
+        log.error("exception occurred while recording run %s: %s", run_id, e)
+    return run, user_list
+
+
+def _archive(class_type, date, user, json_response, last=None, archive=None):
+    """keep a raw response, for the days ``date`` to ``last``, in the archive if there is one"""
+    archive = archive or raw_archive.archive
+    if archive:
+        try:
+            archive.put(class_type.__name__, date, user, json_response, last)
+        except Exception as e:
+            log.error("exception occurred while archiving '%s': %s", class_type.__name__, e)
+
+
+def _load(resource, json_response, user, day, writer, timings=None):
+    """parse a response of ``resource`` and queue its rows in ``writer``, returning the row count"""
+    with metrics.span("parse", resource.name, timings):
+        frames = resource.frames(json_response, user, day)
+
+    for arrow_table, table_name, table_schema in frames:
+        # days without data parse to empty tables, with nothing to load
+        if arrow_table.num_rows:
+            writer.write(arrow_table, table_name, table_schema)
+    return sum(arrow_table.num_rows for arrow_table, _, _ in frames)
+
+
+def _store(resource, first, last, json_response, user, writer, run, started):
+    """archive and load one response of ``resource``, and record it in ``run``
+
+    a response without data is recorded with no rows and no tables, so its
+    days count as ingested and the watermark moves past them.
+    """
+    _archive(resource.class_type, first, user, json_response, last)
+    rows = _load(resource, json_response, user, first, writer, run.timings)
+    tables = [table for table, _ in resource.tables] if rows else []
+    run.ingested(user, resource.class_type, first, last, tables, rows, time.monotonic() - started)
+
+
+def _writer(project_id, run=None):
+    """writer that batches loads into the ingestion dataset for one route call"""
+    return BigQueryWriter(project_id, bigquery_dataset_name, timings=run.timings if run else None)
 
 
 @bp.route("/download")
 def download():
-    project_id, date_pulled, user_list = _process_request(request)
-    for user in user_list:
-        fitbit_bp.storage.user = user
-
-        if fitbit_bp.session.token:
-            del fitbit_bp.session.token
-
-        classes = [
-            [fitbit_classes.HeartRateIntraday, "HeartRateIntraday"],
-            [fitbit_classes.CaloriesIntraday, "CaloriesIntraday"],
-            [fitbit_classes.DistanceIntraday, "DistancesIntraday"],
-            [fitbit_classes.ElevationIntraday, "ElevationIntraday"],
-            [fitbit_classes.FloorsIntraday, "FloorsIntraday"],
-            [fitbit_classes.HrvIntraday, "HrvIntraday"],
-            [fitbit_classes.Spo2Intraday, "Spo2Intraday"],
-            [fitbit_classes.StepsIntraday, "StepsIntraday"],
-            [fitbit_classes.BreathingRateIntraday, "BreathingRateIntraday"],
-            [fitbit_classes.SleepLog, "SleepLog"],
-        ]
+    project_id, start, end, user_list = _process_request(request)
 
-        for class_type, class_string in classes:
-            try:
-                resp = fitbit.get(
-                    class_type.url("-", date_pulled)
-                )
+    _for_each_user(user_list, _concurrency(request), _download_user, start, end)
 
-                log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
-                if resp.status_code == 200:
-                    json_response = resp.json()
-                    filename = f"{class_string}_{date_pulled}_{user}.pickle"
-                    with open(filename, 'wb') as f:
-                        pickle.dump(json_response, f)
+    return "Downloaded"
 
-            except Exception as e:
-                log.error(f"exception occurred while loading '{class_string}': {e}")
 
-        return "Downloaded"
+def _download_user(user, start, end):
+    session = _user_session(user)
+    archive = raw_archive.archive or raw_archive.open_archive("raw_archive")
+
+    days = {resource: (start, end) for resource in resources.RESOURCES if not resource.snapshot}
+    for (url, first, last), fetched in resources.requests(days).items():
+        try:
+            resp = session.get(url)
+
+            log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
+            if resp.status_code == 200:
+                json_response = resp.json()
+                for resource in fetched:
+                    archive.put(resource.name, first, user, json_response, last)
+
+        except Exception as e:
+            log.error(f"exception occurred while loading '{url}': {e}")
 
 
 @bp.route("/fitbit_sleep_scope")
 def fitbit_sleep_scope():
-    project_id, date_pulled, user_list = _process_request(request)
-    for user in user_list:
-        fitbit_bp.storage.user = user
+    project_id, start, end, user_list = _process_request(request)
+    run, user_list = _start_run(request, start, end, user_list)
 
-        if fitbit_bp.session.token:
-            del fitbit_bp.session.token
+    with _writer(project_id, run) as writer:
+        _for_each_user(user_list, _concurrency(request), _ingest_user,
+                       resources.select("sleep"), writer, run)
+    run.commit(writer)
 
-        try:
-            resp = fitbit.get(fitbit_classes.SleepLog.url("-", date_pulled))
-            log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
+    return f"Sleep Scope Loaded (run {run.run_id})"
 
-            sleep = fitbit_classes.SleepLog(resp.json())
 
-            df = sleep.dataframe
-            df.insert(0, "id", user)
+@bp.route("/fitbit_intraday_scope")
+def fitbit_intraday_scope():
+    project_id, start, end, user_list = _process_request(request)
+    run, user_list = _start_run(request, start, end, user_list)
+
+    with _writer(project_id, run) as writer:
+        if ingest_async:
+            asyncio.run(_for_each_user_async(user_list, _concurrency(request), _ingest_user_async,
+                                             resources.select("intraday"), writer, run))
+        else:
+            _for_each_user(user_list, _concurrency(request), _ingest_user,
+                           resources.select("intraday"), writer, run)
+    run.commit(writer)
+
+    return f"Intraday Scope Loaded (run {run.run_id})"
+
+
+@bp.route("/fitbit_daily_scope")
+def fitbit_daily_scope():
+    project_id, start, end, user_list = _process_request(request)
+    run, user_list = _start_run(request, start, end, user_list)
+
+    with _writer(project_id, run) as writer:
+        _for_each_user(user_list, _concurrency(request), _ingest_user,
+                       resources.select("daily", "snapshot"), writer, run)
+    run.commit(writer)
+
+    return f"Daily Scope Loaded (run {run.run_id})"
+
+
+def _ingest_user(user, user_resources, writer, run):
+    """fetch, parse and load ``user_resources`` for ``user``, see ``resources``"""
+    log.debug("user: %s", user)
+    session = _user_session(user)
+    _fetch_token(session, run)
+    devices = _devices(session, run)
+
+    ranged = [resource for resource in user_resources if not resource.snapshot]
+    if ranged:
+        _ingest_ranges(session, user, ranged, writer, run, devices)
+
+    snapshot = [resource for resource in user_resources if resource.snapshot]
+    if snapshot:
+        _ingest_snapshots(session, user, snapshot, writer, run, devices)
+
+
+def _pending_requests(user, user_resources, run, last_sync_date):
+    """``resources.requests`` for the days ``run`` still has to fetch for ``user``"""
+    by_class = {resource.class_type: resource for resource in user_resources}
+    days = run.days(user, list(by_class), last_sync_date)
+
+    fetches = {}
+    for key, fetched in resources.requests(
+        {by_class[class_type]: class_days for class_type, class_days in days.items()}
+    ).items():
+        fetched = [resource for resource in fetched if not run.skip(user, resource.class_type, key[1])]
+        if fetched:
+            fetches[key] = fetched
+    return fetches
+
+
+def _ingest_ranges(session, user, user_resources, writer, run, devices):
+    """fetch the days of ``user_resources``, one request per url and range of days"""
+    fetches = _pending_requests(user, user_resources, run, lambda: _last_sync_date(devices()))
+
+    # a resource stops at its first failed range, whether fitbit refused it or
+    # it raised, and fetches the others on the next run.  the watermark then
+    # stays before the failed range
+    stopped = set()
+    for (url, first, last), fetched in fetches.items():
+        fetched = [resource for resource in fetched if resource.name not in stopped]
+        if not fetched:
+            continue
 
-            meta_df = sleep.meta_dataframe
-            meta_df.insert(0, "id", user)
+        started = time.monotonic()
+        try:
+            resp = _fetch(session, fetched[0].class_type, url, run)
+            if resp.status_code != 200:
+                for resource in fetched:
+                    run.failed(user, resource.class_type, first, last, resp.status_code,
+                               time.monotonic() - started,
+                               retry=resp.status_code in fitbit_rate_limit.RETRY_STATUS)
+                    stopped.add(resource.name)
+                continue
+            json_response = _decode(resp, fetched[0].class_type, run)
         except Exception as e:
-            log.error("exception occurred: %s", str(e))
+            log.error(f"Exception occurred during processing of url '{url}': {e}")
+            for resource in fetched:
+                run.failed(user, resource.class_type, first, last, e, time.monotonic() - started)
+                stopped.add(resource.name)
             continue
 
-        _write_to_bq(df, schema.SLEEP_STAGES_TABLE, project_id, schema.SLEEP_STAGES_SCHEMA)
-        _write_to_bq(meta_df, schema.SLEEP_RECORDS_TABLE, project_id, schema.SLEEP_RECORDS_SCHEMA)
+        for resource in fetched:
+            try:
+                _store(resource, first, last, json_response, user, writer, run, started)
+            except Exception as e:
+                log.error("exception occurred while loading %s for '%s': %s", resource.name, user, e)
+                run.failed(user, resource.class_type, first, last, e, time.monotonic() - started)
+                stopped.add(resource.name)
 
-    fitbit_bp.storage.user = None
 
-    return "Sleep Scope Loaded"
+def _ingest_snapshots(session, user, user_resources, writer, run, devices):
+    """fetch the snapshot resources of ``user`` that are due, and load the ones that changed
 
+    ``Devices`` reuses the response of ``devices()``, see ``_devices``
+    """
+    today = date.today()
+    states = snapshots.get(user)
 
-@bp.route("/fitbit_intraday_scope")
-def fitbit_intraday_scope():
-    project_id, date_pulled, user_list = _process_request(request)
-
-    activities = [
-        [fitbit_classes.HrvIntraday, schema.INTRADAY_HRV_TABLE, schema.INTRADAY_HRV_SCHEMA],
-        [fitbit_classes.Spo2Intraday, schema.INTRADAY_SPO2_TABLE, schema.INTRADAY_SPO2_TABLE],
-        [fitbit_classes.StepsIntraday, schema.INTRADAY_STEPS_TABLE, schema.INTRADAY_STEPS_SCHEMA],
-        [fitbit_classes.FloorsIntraday, schema.INTRADAY_FLOORS_TABLE, schema.INTRADAY_FLOORS_SCHEMA],
-        [fitbit_classes.DistanceIntraday, schema.INTRADAY_DISTANCE_TABLE, schema.INTRADAY_DISTANCE_SCHEMA],
-        [fitbit_classes.ElevationIntraday, schema.INTRADAY_ELEVATION_TABLE, schema.INTRADAY_ELEVATION_SCHEMA],
-        [fitbit_classes.CaloriesIntraday, schema.INTRADAY_CALORIES_TABLE, schema.INTRADAY_CALORIES_SCHEMA],
-        [fitbit_classes.HeartRateIntraday,
-         schema.INTRADAY_HEART_RATE_TABLE,
-         schema.INTRADAY_HEART_RATE_SCHEMA],
-        [fitbit_classes.BreathingRateIntraday,
-         schema.INTRADAY_BREATHING_RATE_TABLE,
-         schema.INTRADAY_BREATHING_RATE_SCHEMA],
-    ]
-
-    for user in user_list:
-        log.debug("user: %s", user)
-        fitbit_bp.storage.user = user
-
-        if fitbit_bp.session.token:
-            del fitbit_bp.session.token
+    for resource in user_resources:
+        state = states.get(resource.name) or {}
+        fetched = state.get("date")
+        if fetched and date.fromisoformat(fetched) > today - timedelta(days=resource.refresh_days):
+            continue
+        day = today.isoformat()
+        if run.skip(user, resource.class_type, day):
+            continue
 
-        for activity in activities:
-            class_type = activity[0]
-            table_name = activity[1]
-            table_schema = activity[2]
+        started = time.monotonic()
+        try:
+            if resource.class_type is fitbit_classes.Devices:
+                resp = devices()
+            else:
+                resp = _fetch(session, resource.class_type, resource.url("-", day, day), run)
+            if resp.status_code != 200:
+                run.failed(user, resource.class_type, day, day, resp.status_code, time.monotonic() - started,
+                           retry=resp.status_code in fitbit_rate_limit.RETRY_STATUS)
+                continue
+            json_response = _decode(resp, resource.class_type, run)
 
-            url = class_type.url("-", date_pulled)
+            digest = hashlib.sha256(json.dumps(json_response, sort_keys=True).encode("utf-8")).hexdigest()
+            if digest == state.get("digest"):
+                log.debug("%s of '%s' did not change", resource.name, user)
+                run.snapshot(user, resource.class_type, day, digest, [])
+                run.ingested(user, resource.class_type, day, day, [], 0, time.monotonic() - started)
+                continue
 
+            _store(resource, day, day, json_response, user, writer, run, started)
+            run.snapshot(user, resource.class_type, day, digest, [table for table, _ in resource.tables])
+        except Exception as e:
+            log.error("exception occurred while loading %s for '%s': %s", resource.name, user, e)
+            run.failed(user, resource.class_type, day, day, e, time.monotonic() - started)
+
+
+async def _last_sync_date_async(client, user):
+    """``_last_sync_date`` with an ``AsyncFitbitClient``"""
+    resp = await client.get(user, "/1/user/-/devices.json")
+    if resp.status_code != 200:
+        return None
+    sync_times = [device["lastSyncTime"] for device in resp.json() if device.get("lastSyncTime")]
+    return max(sync_times)[:10] if sync_times else None
+
+
+async def _ingest_user_async(client, user, user_resources, writer, run):
+    """``_ingest_user`` fetching all the resources of ``user`` at once
+
+    the ranges of one resource are still fetched in order, so a failure
+    stops that resource at the same place as the synchronous version.
+    parsing and loading run on threads, off the event loop.  snapshot
+    resources are not supported.
+    """
+    log.debug("user: %s", user)
+    with metrics.span("token", timings=run.timings):
+        await client.token(user)
+    last_sync = await _last_sync_date_async(client, user) if run.incremental else None
+    fetches = await asyncio.to_thread(_pending_requests, user, user_resources, run, lambda: last_sync)
+
+    # requests sharing a first resource depend on each other's failures
+    chains = {}
+    for key, fetched in fetches.items():
+        chains.setdefault(fetched[0].name, []).append((key, fetched))
+
+    async def _fetch(chain):
+        for (url, first, last), fetched in chain:
+            started = time.monotonic()
             try:
-                resp = fitbit.get(url)
-                log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
+                with metrics.span("http", fetched[0].name, run.timings):
+                    resp = await client.get(user, url)
+                metrics.RESPONSES.inc(resource=fetched[0].name, status=resp.status_code)
+                log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason_phrase)
                 if resp.status_code != 200:
-                    continue
-                df = class_type(resp.json()).dataframe
-                df.insert(0, "id", user)
+                    for resource in fetched:
+                        run.failed(user, resource.class_type, first, last, resp.status_code,
+                                   time.monotonic() - started,
+                                   retry=resp.status_code in fitbit_rate_limit.RETRY_STATUS)
+                    break
+                json_response = _decode(resp, fetched[0].class_type, run)
+                for resource in fetched:
+                    await asyncio.to_thread(_store, resource, first, last, json_response, user, writer,
+                                            run, started)
             except Exception as e:
                 log.error(f"Exception occurred during processing of url '{url}': {e}")
-                continue
+                for resource in fetched:
+                    run.failed(user, resource.class_type, first, last, e, time.monotonic() - started)
+                break
+
+    await asyncio.gather(*(_fetch(chain) for chain in chains.values()))
+
+
+async def _for_each_user_async(user_list, concurrency, func, *args):
+    """``_for_each_user`` for coroutines, ``func(client, user, *args)`` shares one client"""
+
+    def _finish(done):
+        for future in done:
+            user = pending.pop(future)
+            if future.exception():
+                log.error("exception occurred while ingesting '%s': %s", user, future.exception())
+
+    pending = {}
+    async with AsyncFitbitClient(fitbit_bp) as client:
+        for user in user_list:
+            if len(pending) >= concurrency:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                _finish(done)
+            pending[asyncio.ensure_future(func(client, user, *args))] = user
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            _finish(done)
+
+
+@bp.route("/dispatch")
+def dispatch():
+    """queue the ingestion of every resource as tasks for `/work`
+
+    accepts the same parameters as the ingestion routes.  each task covers
+    `DISPATCH_USERS_PER_TASK` users, every resource and all the days of the
+    run, and is loaded by a single ``BigQueryWriter``: a task costs one load
+    job, and one MERGE, per table.  a task per user or range of days would
+    spread the run more evenly over the instances, but at the cost of a load
+    job and a MERGE per table for each of them, which a backfill of many
+    users would take well past bigquery's load job and DML quotas.
+
+    the tradeoff is that a task takes longer.  lower the setting when the
+    tasks of a long backfill run into the Cloud Tasks dispatch deadline.
+    a retried task skips the units the run ledger lists as loaded, so only
+    what failed is fetched again.
+    """
+    _, start, end, user_list = _process_request(request)
+    run, user_list = _start_run(request, start, end, user_list)
+    queue = work_queue.queue
+
+    task = {"resources": list(resources.BY_NAME), "start": run.start, "end": run.end,
+            "incremental": run.incremental, "run_id": run.run_id}
+    tasks = 0
+    users = []
+    for user in user_list:
+        users.append(user)
+        if len(users) >= dispatch_users_per_task:
+            queue.put(dict(task, users=users))
+            tasks += 1
+            users = []
+    if users:
+        queue.put(dict(task, users=users))
+        tasks += 1
+
+    log.info("run %s: dispatched %d tasks", run.run_id, tasks)
+    return f"Dispatched {tasks} tasks (run {run.run_id})"
+
+
+@bp.route("/work", methods=["GET", "POST"])
+def work():
+    """process one task, posted by cloud tasks or claimed from the local queue
+
+    responds with a 500 when the task failed, which makes cloud tasks retry
+    it.  the local queue retries it on a later call.
+    """
+    task = request.get_json(silent=True)
+    if task:
+        errors = _work(task)
+        if errors:
+            return "Task Failed: " + "; ".join(errors), 500
+        return "Task Done"
+
+    if not hasattr(work_queue.queue, "claim"):
+        abort(400, "expected a task")
+
+    claimed = work_queue.queue.claim()
+    if claimed is None:
+        return "No Work", 204
+
+    task_id, task = claimed
+    try:
+        errors = _work(task)
+    except Exception as e:
+        errors = [str(e)]
+
+    if errors:
+        work_queue.queue.fail(task_id, "; ".join(errors))
+        return "Task Failed: " + "; ".join(errors), 500
+
+    work_queue.queue.done(task_id)
+    return "Task Done"
+
+
+def _work(task):
+    """ingest one queued task, returning the errors that should make it retry
+
+    the users of the task are ingested ``INGEST_CONCURRENCY`` at a time,
+    into one writer.  tasks queued before they held several users name a
+    single `user`.
+    """
+    task_resources = [resources.BY_NAME[name] for name in task["resources"]]
+    users = task.get("users") or [task["user"]]
+    run_id = task.get("run_id")
+    # a retried task skips what an earlier attempt already loaded
+    completed = [
+        (unit["user"], unit["resource"], unit["date"])
+        for user in (users if run_id else [])
+        for unit in run_ledger.units(run_id, user)
+        if unit.get("status") == "loaded"
+    ]
+    run = _IngestRun(task["start"], task["end"], task.get("incremental", False), run_id, completed)
+
+    with _writer(os.environ.get("GOOGLE_CLOUD_PROJECT"), run) as writer:
+        failed = _for_each_user(users, ingest_concurrency, _ingest_user, task_resources, writer, run)
+    run.commit(writer)
+
+    return (run.errors + [f"'{user}': {e}" for user, e in failed.items()]
+            + [f"failed to load {table}" for table in writer.failed])
+
+
+@bp.route("/replay")
+def replay():
+    """rebuild the tables for the requested days from the raw archive
 
-            _write_to_bq(df, table_name, project_id, table_schema)
+    accepts the same `date`, `start`, `end` and `user` parameters as the
+    ingestion routes.  `user` may name a user that no longer has a token.
+    date range responses overlapping the requested days are loaded whole,
+    including their days outside of them.
+    """
+    if not raw_archive.archive:
+        abort(400, "RAW_ARCHIVE_URI is not configured")
 
-    fitbit_bp.storage.user = None
+    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
+    start, end = _dates(request)
+    user = request.args.get("user")
+
+    with _writer(project_id) as writer:
+        for resource in resources.RESOURCES:
+            for user_id, first, _, json_response in raw_archive.archive.ranges(
+                resource.name, start, end, resource.class_type.MAX_RANGE_DAYS, user
+            ):
+                try:
+                    _load(resource, json_response, user_id, first, writer)
+                except Exception as e:
+                    log.error("exception occurred while replaying %s for '%s': %s", resource.name, user_id, e)
+
+    return "Replayed"
+
+
+@bp.route("/export")
+def export():
+    """stream the parsed rows of one user for the requested days
+
+    accepts the `date`, `start` and `end` parameters of the ingestion
+    routes, and:
+
+        * `user`: required, the user to export.
+        * `table`: tables to export, comma separated, defaults to every
+            table of the sleep, intraday and daily resources.
+        * `format`: `ndjson` (the default), one json row per line with a
+            `table` field, or `arrow`, an arrow ipc stream of a single
+            `table` with the types of its schema.
+
+    responses come from the raw archive when it has one for the same days,
+    the others are fetched from fitbit.  one
+    response is parsed at a time and sent in chunks of `EXPORT_CHUNK_ROWS`
+    rows, so the memory used does not grow with the number of days.
+    """
+    user = request.args.get("user")
+    if not user:
+        abort(400, "user is required")
+    if not (raw_archive.archive or fitbit_bp.storage.has_user(user)):
+        abort(404, f"unknown user '{user}'")
+    start, end = _dates(request)
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        abort(400, "format must be one of " + ", ".join(EXPORT_FORMATS))
+
+    tables = {
+        table: table_schema
+        for resource in resources.RESOURCES if not resource.snapshot
+        for table, table_schema in resource.tables
+    }
+    if request.args.get("table"):
+        names = request.args.get("table").split(",")
+        unknown = [name for name in names if name not in tables]
+        if unknown:
+            abort(400, "unknown table " + ", ".join(unknown))
+        tables = {name: tables[name] for name in names}
+    if export_format == "arrow" and len(tables) != 1:
+        abort(400, "format=arrow exports a single table")
+
+    rows = _export_rows(user, start, end, tables)
+    if export_format == "arrow":
+        body = _arrow_stream(rows, *tables.values())
+    else:
+        body = _ndjson_stream(rows)
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format])
+
+
+def _export_rows(user, start, end, tables):
+    """yield ``(table, dataframe)`` chunks of the rows of ``user`` for ``tables``"""
+    session = None
+    for resource in resources.RESOURCES:
+        wanted = [table for table, _ in resource.tables if table in tables]
+        if resource.snapshot or not wanted:
+            continue
+
+        for first, last in resource.date_ranges(start, end):
+            json_response = None
+            if raw_archive.archive:
+                for _, _, archived_last, payload in raw_archive.archive.ranges(resource.name, first, first,
+                                                                                user=user):
+                    if archived_last == last:
+                        json_response = payload
+
+            if json_response is None:
+                session = session or _user_session(user)
+                try:
+                    resp = session.get(resource.url("-", first, last))
+                    log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
+                    if resp.status_code != 200:
+                        log.error("export of %s for '%s' stopped at %s: %d [%s]",
+                                  resource.name, user, first, resp.status_code, resp.reason)
+                        break
+                    json_response = resp.json()
+                except Exception as e:
+                    log.error("exception occurred while exporting %s for '%s': %s", resource.name, user, e)
+                    break
+
+            for arrow_table, table, _ in resource.frames(json_response, user, first):
+                if table in wanted:
+                    for offset in range(0, arrow_table.num_rows, export_chunk_rows):
+                        yield table, arrow_table.slice(offset, export_chunk_rows)
+
+
+def _ndjson_stream(rows):
+    for table, arrow_table in rows:
+        # dates as "YYYY-MM-DD" rather than midnight timestamps
+        for index, field in enumerate(arrow_table.schema):
+            if pa.types.is_date(field.type):
+                arrow_table = arrow_table.set_column(index, field.name, arrow_table[field.name].cast(pa.string()))
+        df = arrow_table.to_pandas()
+        df.insert(0, "table", table)
+        yield df.to_json(orient="records", lines=True, date_format="iso")
+
+
+def _arrow_stream(rows, table_schema):
+    arrow_schema = pa.schema(
+        [(field["name"], ARROW_TYPES.get(field["type"].upper(), pa.string())) for field in table_schema]
+    )
+
+    def _drain(sink):
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, arrow_schema) as writer:
+        for _, arrow_table in rows:
+            columns = [
+                arrow_table[field.name].cast(field.type) if field.name in arrow_table.column_names
+                else pa.nulls(arrow_table.num_rows, field.type)
+                for field in arrow_schema
+            ]
+            writer.write_table(pa.Table.from_arrays(columns, schema=arrow_schema))
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+@bp.route("/refresh_tokens")
+def refresh_tokens():
+    """refresh, in parallel, every token expiring within the refresh window
+
+    users whose refresh token is rejected are marked in firestore and
+    skipped by the ingestion routes until they authorize again.
+    """
+    _, _, _, user_list = _process_request(request)
+    counts = {"refreshed": 0, "current": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def _refresh_user(user):
+        session = _user_session(user)
+        try:
+            refreshed = session.expires_within(token_refresh_window)
+            if refreshed:
+                session.refresh(within=token_refresh_window)
+            result = "refreshed" if refreshed else "current"
+        except Exception as e:
+            log.error("exception occurred while refreshing the token of '%s': %s", user, e)
+            result = "failed"
+        with lock:
+            counts[result] += 1
 
-    return "Intraday Scope Loaded"
+    _for_each_user(user_list, _concurrency(request), _refresh_user)
+    log.info("token refresh: %s", counts)
+
+    return "Tokens Refreshed: {refreshed} refreshed, {current} current, {failed} failed".format(**counts)
+
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    """timings and counters of the ingestion, in the prometheus text format"""
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
 
 
 @bp.route("/ingest")
@@ -250,25 +1072,19 @@ def ingest():
     """test route to ensure that blueprint is loaded"""
 
     result = []
-    all_users = fitbit_bp.storage.all_users()
-    log.debug(all_users)
-
-    for x in all_users:
+    for x in fitbit_bp.storage.all_users():
         try:
             log.debug("user = " + x)
 
-            fitbit_bp.storage.user = x
-            if fitbit_bp.session.token:
-                del fitbit_bp.session.token
-
-            token = fitbit_bp.token
+            session = _user_session(x)
+            token = session.token
 
             log.debug("access token: " + token["access_token"])
             log.debug("refresh_token: " + token["refresh_token"])
             log.debug("expiration time " + str(token["expires_at"]))
             log.debug("             in " + str(token["expires_in"]))
 
-            resp = fitbit.get("/1/user/-/profile.json")
+            resp = session.get("/1/user/-/profile.json")
 
             log.debug("%s: %d [%s]", resp.url, resp.status_code, resp.reason)
 
@@ -0,0 +1,133 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""scheduling of fitbit web api requests within the per-user rate limit
+
+Fitbit allows each user 150 requests an hour and reports what is left of
+that budget on every response, in the `Fitbit-Rate-Limit-Remaining` and
+`Fitbit-Rate-Limit-Reset` headers (the latter in seconds until the budget is
+renewed).  ``RateLimiter`` keeps track of those values per user and holds a
+request back until the budget is renewed once it has run out, instead of
+letting it fail with a 429.
+
+``backoff`` computes the jittered delay used when retrying 429 and 5xx
+responses.
+
+Configuration:
+
+    * `FITBIT_MAX_RETRIES`: optional, number of times a request failing with
+        a 429 or 5xx status is retried (default 5).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+max_retries = int(os.environ.get("FITBIT_MAX_RETRIES", 5))
+
+# status codes worth retrying, the others are returned to the caller
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+REMAINING_HEADER = "Fitbit-Rate-Limit-Remaining"
+RESET_HEADER = "Fitbit-Rate-Limit-Reset"
+
+
+def backoff(attempt, base=1.0, cap=60.0):
+    """delay before retry number ``attempt``: exponential with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimiter:
+    """Tracks the remaining fitbit request budget of each user.
+
+    Call ``acquire`` before each request, it blocks while the user's budget
+    is used up, or ``await acquire_async`` in a coroutine.  Call ``update``
+    with the response headers afterwards.
+
+    Users with no response seen yet are not limited, their budget is
+    learned from the first response.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._budgets = {}
+
+    def acquire(self, user):
+        """wait until ``user`` may send a request, and count it against the budget"""
+        with self._condition:
+            while True:
+                wait = self._take(user)
+                if not wait:
+                    return
+
+                log.info("rate limit reached for %s, waiting %.0fs", user, wait)
+                self._condition.wait(wait)
+
+    async def acquire_async(self, user, poll=60.0):
+        """``acquire`` for coroutines, waiting in the event loop instead of a thread
+
+        the budget is checked again at least every ``poll`` seconds, as a
+        response of another request may renew it before the reset time.
+        """
+        while True:
+            with self._condition:
+                wait = self._take(user)
+            if not wait:
+                return
+
+            log.info("rate limit reached for %s, waiting %.0fs", user, wait)
+            await asyncio.sleep(min(wait, poll))
+
+    def _take(self, user):
+        """count a request against ``user``'s budget, or return the seconds until it is renewed"""
+        budget = self._budgets.get(user)
+        now = time.monotonic()
+        if budget is None or now >= budget["reset_at"]:
+            self._budgets.pop(user, None)
+            return 0
+        if budget["remaining"] > 0:
+            budget["remaining"] -= 1
+            return 0
+        return budget["reset_at"] - now
+
+    def update(self, user, headers):
+        """record the budget reported in the headers of a response for ``user``"""
+        try:
+            remaining = int(headers[REMAINING_HEADER])
+            reset = int(headers[RESET_HEADER])
+        except (KeyError, ValueError):
+            return
+
+        with self._condition:
+            self._budgets[user] = {
+                "remaining": remaining,
+                "reset_at": time.monotonic() + reset,
+            }
+            self._condition.notify_all()
+
+    def remaining(self, user):
+        """remaining budget for ``user``, or None when unknown"""
+        with self._condition:
+            budget = self._budgets.get(user)
+            if budget is None or time.monotonic() >= budget["reset_at"]:
+                return None
+            return budget["remaining"]
+
+
+# shared by all sessions of this process
+rate_limiter = RateLimiter()
@@ -0,0 +1,219 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""per-user oauth sessions for calling the fitbit web apis
+
+flask-dance keeps a single session on the blueprint and selects the user
+through ``fitbit_bp.storage.user``.  that works for the user-facing routes,
+which only ever deal with the logged in user, but not for ingestion where
+many users are processed by many threads at the same time.
+
+``FitbitUserSession`` is bound to one user for its whole lifetime.  it reads
+that user's token from ``FirestoreStorage`` and writes refreshed tokens back
+to it, without touching any shared state.
+
+requests are scheduled through ``fitbit_rate_limit.rate_limiter``, so they
+wait for the user's hourly budget to be renewed rather than fail, and 429 or
+5xx responses are retried with a jittered backoff.
+
+Example::
+
+    session = FitbitUserSession("user@domain.com", fitbit_bp)
+    resp = session.get("/1/user/-/profile.json")
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import requests
+from oauthlib.oauth2 import InvalidGrantError
+from requests.auth import HTTPBasicAuth
+from requests_oauthlib import OAuth2Session as BaseOAuth2Session
+from flask_dance.consumer.requests import OAuth2Session
+from werkzeug.utils import cached_property
+
+from . import fitbit_rate_limit
+
+log = logging.getLogger(__name__)
+
+# refresh tokens this many seconds before they actually expire
+EXPIRY_MARGIN = 60
+
+# refreshes tried by one call of ``refresh`` when another process keeps
+# using the refresh token first
+REFRESH_ATTEMPTS = 3
+
+# fitbit refresh tokens can be used only once, so two sessions for the
+# same user must never refresh at the same time.
+_refresh_locks = defaultdict(threading.Lock)
+_refresh_locks_lock = threading.Lock()
+
+
+def _refresh_lock(user):
+    with _refresh_locks_lock:
+        return _refresh_locks[user]
+
+
+def _expires_in(token):
+    """update ``expires_in`` from ``expires_at``, as flask-dance does"""
+    if token and token.get("expires_at"):
+        expires_at = datetime.fromtimestamp(token["expires_at"], timezone.utc)
+        token["expires_in"] = (expires_at - datetime.now(timezone.utc)).total_seconds()
+    return token
+
+
+class FitbitUserSession(OAuth2Session):
+    """flask-dance oauth session bound to a single user.
+
+    Args:
+        user: key of the user's token document in ``storage``.
+        blueprint: the flask-dance fitbit blueprint, used for the client
+            credentials and api urls.
+        storage: token storage, defaults to the blueprint's storage.
+        rate_limiter: ``RateLimiter`` used to schedule requests, defaults to
+            the one shared by the whole process.
+        max_retries: number of retries for 429, 5xx and connection errors.
+
+    Each instance is meant to be used by one thread.  Create one session
+    per user (and per thread) rather than sharing them.
+    """
+
+    def __init__(self, user, blueprint, storage=None, rate_limiter=None, max_retries=None):
+        super().__init__(
+            client_id=blueprint.client_id,
+            blueprint=blueprint,
+            base_url=blueprint.base_url,
+        )
+        self.user = user
+        self.storage = storage or blueprint.storage
+        self.token_url = blueprint.token_url
+        self.client_secret = blueprint.client_secret
+        self.token_updater = self.save_token
+        self.rate_limiter = rate_limiter or fitbit_rate_limit.rate_limiter
+        self.max_retries = fitbit_rate_limit.max_retries if max_retries is None else max_retries
+
+    @cached_property
+    def token(self):
+        return _expires_in(self.storage.load(self.user))
+
+    def expires_within(self, seconds):
+        """true if the access token expires in the next ``seconds``"""
+        expires_at = self.token.get("expires_at") if self.token else None
+        return bool(expires_at) and expires_at < time.time() + seconds
+
+    @property
+    def expired(self):
+        return self.expires_within(EXPIRY_MARGIN)
+
+    def save_token(self, token):
+        """store a new token for this user, and use it for further requests"""
+        if token and token.get("expires_in"):
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=int(token["expires_in"]))
+            token["expires_at"] = expires_at.timestamp()
+        self.storage.save(self.user, token)
+        self.token = token
+
+    def refresh(self, within=EXPIRY_MARGIN, rejected=None):
+        """exchange the refresh token for a new access token.
+
+        the token is re-read from storage first, in case another session
+        already refreshed it, and is only refreshed if it expires in the next
+        ``within`` seconds, or if its access token is ``rejected``, one that
+        fitbit refused.  the token is refreshed once.
+
+        the lock is per process, so another process may use the same
+        refresh token first: when fitbit rejects it, the token that process
+        stored is read from firestore and used, unless it is already
+        unusable too, in which case it is refreshed again, up to
+        ``REFRESH_ATTEMPTS`` times in all.  a refresh token that is still
+        the stored one when it is rejected (revoked) is marked as failed in
+        storage before the error is raised.
+        """
+        with _refresh_lock(self.user):
+            self.__dict__.pop("token", None)
+            if not (self.expires_within(within) or self._rejected(rejected)):
+                return self.token
+
+            for attempt in range(REFRESH_ATTEMPTS):
+                refresh_token = self.token.get("refresh_token")
+                log.debug("refreshing token for %s", self.user)
+                try:
+                    token = self.refresh_token(
+                        self.token_url,
+                        refresh_token=refresh_token,
+                        auth=HTTPBasicAuth(self.client_id, self.client_secret),
+                    )
+                except InvalidGrantError as e:
+                    if self.storage.mark_refresh_failed(self.user, e.description or e.error, refresh_token):
+                        log.warning("refresh token of %s was rejected: %s", self.user, e)
+                        raise
+                    if attempt + 1 >= REFRESH_ATTEMPTS:
+                        raise
+                    log.info("refresh token of %s was already used elsewhere, reading the new token", self.user)
+                    self.token = _expires_in(self.storage.load(self.user, cached=False))
+                    if not (self.expired or self._rejected(rejected)):
+                        return self.token
+                    continue
+
+                self.save_token(token)
+                return token
+
+    def _rejected(self, rejected):
+        """true if the current access token is ``rejected``"""
+        return bool(rejected) and self.token.get("access_token") == rejected
+
+    def request(self, method, url, data=None, headers=None, **kwargs):
+        if self.base_url:
+            url = self.base_url.relative(url)
+        if kwargs.get("withhold_token"):
+            # token requests, made while refreshing, do not use the api budget
+            return BaseOAuth2Session.request(
+                self, method=method, url=url, data=data, headers=headers, **kwargs
+            )
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(self.user)
+            try:
+                resp = self._send(method, url, data=data, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = fitbit_rate_limit.backoff(attempt)
+                log.warning("%s failed (%s), retrying in %.1fs", url, e, delay)
+            else:
+                self.rate_limiter.update(self.user, resp.headers)
+                if (resp.status_code not in fitbit_rate_limit.RETRY_STATUS
+                        or attempt >= self.max_retries):
+                    return resp
+                # after a 429 the rate limiter already holds the next attempt
+                # back until the budget is renewed, only add some jitter
+                if resp.status_code == 429:
+                    delay = fitbit_rate_limit.backoff(0)
+                else:
+                    delay = fitbit_rate_limit.backoff(attempt)
+                log.warning("%s: %d [%s], retrying in %.1fs", url, resp.status_code, resp.reason, delay)
+
+            attempt += 1
+            time.sleep(delay)
+
+    def _send(self, method, url, **kwargs):
+        if self.expired:
+            self.refresh()
+        self.load_token()
+        # skip flask-dance's request(), which reads the client credentials
+        # from the blueprint's shared session
+        return BaseOAuth2Session.request(self, method=method, url=url, **kwargs)
@@ -33,16 +33,22 @@ Routes:
     /splash - show application splash page and login button
 
     the rest of the routes are provided by other modules.
+
+Commands:
+
+    flask provision-tables - create the bigquery tables, partitioned and
+        clustered, or update them.  see ``bigquery_provision``.
 """
 import os
 import logging
+import click
 from flask import Flask, session, redirect, render_template, request, url_for
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_dance.contrib.fitbit import fitbit
 
 from .fitbit_auth import bp as fitbit_auth_bp, fitbit_bp
 from .frontend import bp as frontend_bp
-from .fitbit_ingest import bp as fitbit_ingest_bp
+from .fitbit_ingest import bp as fitbit_ingest_bp, bigquery_dataset_name
 
 
 #
@@ -104,5 +110,25 @@ def index():
     )
 
 
+#
+# commands
+#
+
+
+@app.cli.command("provision-tables")
+@click.option("--dry-run", is_flag=True, help="only list the changes")
+def provision_tables(dry_run):
+    """Create or update the bigquery tables declared in schema.py"""
+    from google.cloud import bigquery
+    from .bigquery_provision import provision
+
+    client = bigquery.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+    changed = provision(client, bigquery_dataset_name, dry_run=dry_run)
+    for table, changes in changed.items():
+        click.echo(f"{table}: {', '.join(changes)}")
+    if not changed:
+        click.echo("all tables are up to date")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0")
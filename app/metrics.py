@@ -0,0 +1,186 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""timings and counters of the ingestion, in the prometheus text format
+
+each (user, resource) fetched by the ingestion routes goes through the
+same stages, timed with ``span``:
+
+    * `token`: reading the user's token, and refreshing it if needed.
+    * `http`: the fitbit request, including rate limit waits and retries.
+    * `decode`: decoding the json response.
+    * `parse`: building the dataframes with ``fitbit_classes``.
+    * `load`: loading a table into bigquery, per table rather than
+        resource, as ``BigQueryWriter`` loads many users at once.
+
+the timings are kept for the life of the process and served by the
+`/metrics` route, and ``Timings`` adds them up for a single run, for the
+summary logged at its end.
+
+Example::
+
+    timings = Timings()
+    with span("http", "SleepLog", timings):
+        resp = session.get(url)
+    RESPONSES.inc(resource="SleepLog", status=resp.status_code)
+    log.info("time per stage: %s", timings.summary())
+
+the values are per process, so with several gunicorn workers each one
+reports its own.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds, in seconds, of the buckets of the stage histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """monotonic count per combination of labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, _labels(self.labels, key), value
+
+
+class Histogram:
+    """distribution of observed values per combination of labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(c + (value <= bound) for c, bound in zip(counts, self.buckets))
+            self._values[key] = counts, total + value, count + 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+
+        names = self.labels + ("le",)
+        for key, (counts, total, count) in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield self.name + "_bucket", _labels(names, key + (bound,)), bucket_count
+            yield self.name + "_bucket", _labels(names, key + ("+Inf",)), count
+            yield self.name + "_sum", _labels(self.labels, key), total
+            yield self.name + "_count", _labels(self.labels, key), count
+
+
+STAGE_SECONDS = Histogram(
+    "fitbit_ingest_stage_seconds", "time spent in each stage of the ingestion", ["stage", "resource"]
+)
+STAGE_ERRORS = Counter(
+    "fitbit_ingest_stage_errors_total", "stages that raised an exception", ["stage", "resource"]
+)
+RESPONSES = Counter(
+    "fitbit_ingest_responses_total", "fitbit api responses by status", ["resource", "status"]
+)
+ROWS = Counter("fitbit_ingest_rows_total", "rows loaded into bigquery", ["table"])
+RUNS = Counter("fitbit_ingest_runs_total", "ingestion runs started", ["route"])
+UNITS = Counter("fitbit_ingest_units_total", "units of work at the end of the runs", ["status"])
+
+
+class Timings:
+    """time per stage for one run, added up from the spans given this object"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            count, total, longest = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = count + 1, total + seconds, max(longest, seconds)
+
+    def totals(self):
+        """``{stage: (count, seconds, longest)}``"""
+        with self._lock:
+            return dict(self._stages)
+
+    def summary(self):
+        """one line with the count, total and longest time of each stage"""
+        return ", ".join(
+            f"{stage} {count}x {total:.1f}s (max {longest:.2f}s)"
+            for stage, (count, total, longest) in sorted(self.totals().items())
+        ) or "nothing timed"
+
+
+@contextmanager
+def span(stage, resource="", timings=None):
+    """time the block as ``stage`` of ``resource``, and add it to ``timings`` if given"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage, resource=resource)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, resource=resource)
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def render():
+    """every metric in the prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
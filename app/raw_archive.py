@@ -0,0 +1,195 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""archive of the raw fitbit responses
+
+Every response the ingestion routes receive can be kept as gzipped json,
+either in a local directory or in a cloud storage bucket.  Responses are
+stored under::
+
+    <class>/<date>/<user>/<last>-<sha256 of the json>.json.gz
+
+where ``class`` is the ``fitbit_classes`` parser for the response,
+``date`` the first day it covers and ``last`` the last one, the same day
+unless the response is for a date range.  Storing the same response twice
+is a no-op, and when a day is fetched again after more data was synced the
+newest response wins.  responses archived before the last day was part of
+the key are read as covering their first day only.
+
+The archive allows the bigquery tables to be rebuilt with the current
+parsers without calling fitbit again, see the `/replay` route.
+
+Example::
+
+    archive = open_archive("gs://my-bucket/fitbit-raw")
+    archive.put("SleepLog", "2022-03-01", "user@domain.com", resp.json(), last="2022-03-30")
+    for user, payload in archive.latest("SleepLog", "2022-03-01"):
+        ...
+    for user, first, last, payload in archive.ranges("SleepLog", "2022-03-10", "2022-03-12", 100):
+        ...
+
+Configuration:
+
+    * `RAW_ARCHIVE_URI`: optional, a local directory or a `gs://bucket/prefix`
+        location.  if set, all ingested responses are archived there.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+raw_archive_uri = os.environ.get("RAW_ARCHIVE_URI")
+
+
+def _encode(payload):
+    """canonical json bytes for ``payload`` and their content address"""
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _last_day(key, first):
+    """last day covered by the response stored under ``key``"""
+    last, _, _ = key.rsplit("/", 1)[1].rpartition("-")
+    return last or first
+
+
+class RawArchive:
+    """Base class for the archive backends, see ``open_archive``."""
+
+    def put(self, class_name, date, user, payload, last=None):
+        """store ``payload``, covering the days ``date`` to ``last``, and return its key"""
+        data, digest = _encode(payload)
+        key = f"{class_name}/{date}/{user}/{last or date}-{digest}.json.gz"
+        if not self._exists(key):
+            self._write(key, gzip.compress(data))
+        return key
+
+    def get(self, key):
+        return json.loads(gzip.decompress(self._read(key)))
+
+    def latest(self, class_name, date, user=None):
+        """yield ``(user, payload)`` with the newest response of each user for a class and date"""
+        for key_user, key in self._newest(class_name, date, user).items():
+            yield key_user, self.get(key)
+
+    def ranges(self, class_name, start, end, max_days=1, user=None):
+        """yield ``(user, first, last, payload)`` for the newest responses covering a day from ``start`` to ``end``
+
+        responses are archived under their first day, and a class covers
+        at most ``max_days`` days per response (its ``MAX_RANGE_DAYS``), so
+        the days listed start ``max_days - 1`` days before ``start``.  a
+        response is yielded whole, with days outside ``start`` to ``end``.
+        """
+        first = datetime.date.fromisoformat(start) - datetime.timedelta(days=max_days - 1)
+        while first <= datetime.date.fromisoformat(end):
+            for key_user, key in self._newest(class_name, first.isoformat(), user).items():
+                last = _last_day(key, first.isoformat())
+                if last >= start:
+                    yield key_user, first.isoformat(), last, self.get(key)
+            first += datetime.timedelta(days=1)
+
+    def _newest(self, class_name, date, user=None):
+        """``{user: key}`` of the newest response of each user for a class and first day"""
+        newest = {}
+        for key, updated in self._list(f"{class_name}/{date}/"):
+            key_user = key.split("/")[2]
+            if user and key_user != user:
+                continue
+            if key_user not in newest or updated > newest[key_user][1]:
+                newest[key_user] = (key, updated)
+        return {key_user: key for key_user, (key, _) in newest.items()}
+
+    def _exists(self, key):
+        raise NotImplementedError()
+
+    def _write(self, key, data):
+        raise NotImplementedError()
+
+    def _read(self, key):
+        raise NotImplementedError()
+
+    def _list(self, prefix):
+        """yield ``(key, updated)`` for all keys below ``prefix``"""
+        raise NotImplementedError()
+
+
+class LocalArchive(RawArchive):
+    """archive in a local directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _exists(self, key):
+        return os.path.exists(os.path.join(self.path, key))
+
+    def _write(self, key, data):
+        filename = os.path.join(self.path, key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(filename + ".tmp", filename)
+
+    def _read(self, key):
+        with open(os.path.join(self.path, key), "rb") as f:
+            return f.read()
+
+    def _list(self, prefix):
+        directory = os.path.join(self.path, prefix)
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    filename = os.path.join(root, name)
+                    key = os.path.relpath(filename, self.path).replace(os.sep, "/")
+                    yield key, os.path.getmtime(filename)
+
+
+class GcsArchive(RawArchive):
+    """archive in a cloud storage bucket"""
+
+    def __init__(self, bucket, prefix=""):
+        from google.cloud import storage
+
+        self.bucket = storage.Client().bucket(bucket)
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _exists(self, key):
+        return self.bucket.blob(self.prefix + key).exists()
+
+    def _write(self, key, data):
+        self.bucket.blob(self.prefix + key).upload_from_string(
+            data, content_type="application/gzip"
+        )
+
+    def _read(self, key):
+        return self.bucket.blob(self.prefix + key).download_as_bytes()
+
+    def _list(self, prefix):
+        for blob in self.bucket.list_blobs(prefix=self.prefix + prefix):
+            yield blob.name[len(self.prefix):], blob.updated
+
+
+def open_archive(uri):
+    """archive for a local path or a `gs://bucket/prefix` uri"""
+    if uri.startswith("gs://"):
+        bucket, _, prefix = uri[len("gs://"):].partition("/")
+        return GcsArchive(bucket, prefix)
+    return LocalArchive(uri)
+
+
+# archive written by the ingestion routes, if one is configured
+archive = open_archive(raw_archive_uri) if raw_archive_uri else None
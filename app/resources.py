@@ -0,0 +1,182 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""registry of the fitbit resources that are ingested
+
+each ``Resource`` in ``RESOURCES`` ties a ``fitbit_classes`` parser to
+its url, the bigquery tables it loads into with their schema, and how it
+is scheduled; the tables' natural keys are in ``schema.MERGE_KEYS``.  the
+ingestion routes, `/dispatch`, `/work`, `/download` and `/replay` all go
+through this list, so a resource added here is fetched, batched, archived
+and loaded like the others.
+
+resources belong to a group, the ingestion route that fetches them:
+
+    * `sleep`: the sleep log, into the sleep stages and sleep records.
+    * `intraday`: the intraday time series, one row per sample.
+    * `daily`: daily summaries and logs, with the day they were fetched for.
+    * `snapshot`: the current state of the user (devices, goals, badges,
+        friends), fetched every ``refresh_days`` days and loaded only when
+        it changed.
+
+resources with the same url, e.g. the activity summary and the activity
+logs, are fetched with a single request, see ``requests``.
+
+Example::
+
+    days = {resource: ("2022-03-01", "2022-03-07") for resource in select("daily")}
+    for (url, first, last), fetched in requests(days).items():
+        json_response = session.get(url).json()
+        for resource in fetched:
+            for arrow_table, table, table_schema in resource.frames(json_response, user, first):
+                writer.write(arrow_table, table, table_schema)
+"""
+from . import fitbit_classes
+from . import schema
+from .bigquery_writer import to_arrow
+
+GROUPS = ("sleep", "intraday", "daily", "snapshot")
+
+
+class Resource:
+    """a fitbit resource, parsed by ``class_type`` into ``tables``
+
+    Args:
+        class_type: the ``fitbit_classes`` parser.
+        group: one of ``GROUPS``.
+        tables: ``(table, schema)`` pairs.  the parser's ``dataframe`` is
+            loaded into the first table, its ``meta_dataframe`` into the
+            second if there is one.
+        refresh_days: for snapshots, the days between two fetches.
+    """
+
+    def __init__(self, class_type, group, tables, refresh_days=None):
+        if group not in GROUPS:
+            raise ValueError(f"unknown resource group '{group}'")
+        self.class_type = class_type
+        self.name = class_type.__name__
+        self.group = group
+        self.tables = list(tables)
+        self.refresh_days = refresh_days
+
+    def __repr__(self):
+        return f"Resource({self.name}, {self.group})"
+
+    @property
+    def snapshot(self):
+        return self.group == "snapshot"
+
+    def date_ranges(self, start, end):
+        """(first, last) of the requests fetching the days ``start`` to ``end``
+
+        a snapshot is not a range of days, it is fetched once as of ``start``.
+        """
+        if self.snapshot:
+            return [(start, start)]
+        return list(self.class_type.date_ranges(start, end))
+
+    def url(self, user, first, last):
+        """url fetching the days ``first`` to ``last``, see ``date_ranges``"""
+        if self.snapshot:
+            return self.class_type.url(user)
+        return self.class_type.range_url(user, first, last)
+
+    def frames(self, json_response, user, day):
+        """``(arrow table, table, schema)`` for each table, with the ``id`` of ``user``
+
+        the parsed dataframes are converted with ``bigquery_writer.to_arrow``,
+        ready for ``BigQueryWriter.write``.  daily and snapshot rows also get
+        the ``day`` fetched as their `date`, unless the parser gives one,
+        and the columns of the schema.
+        """
+        parsed = self.class_type(json_response)
+        dataframes = [parsed.dataframe]
+        if len(self.tables) > 1:
+            dataframes.append(parsed.meta_dataframe)
+
+        frames = []
+        for df, (table, table_schema) in zip(dataframes, self.tables):
+            if self.group in ("daily", "snapshot"):
+                if "date" not in df.columns:
+                    df = df.assign(date=day)
+                df = df.reindex(columns=[field["name"] for field in table_schema if field["name"] != "id"])
+            arrow_table, _ = to_arrow(df, table_schema, {"id": user})
+            frames.append((arrow_table, table, table_schema))
+        return frames
+
+
+RESOURCES = [
+    Resource(fitbit_classes.SleepLog, "sleep", [
+        (schema.SLEEP_STAGES_TABLE, schema.SLEEP_STAGES_SCHEMA),
+        (schema.SLEEP_RECORDS_TABLE, schema.SLEEP_RECORDS_SCHEMA),
+    ]),
+    Resource(fitbit_classes.HrvIntraday, "intraday",
+             [(schema.INTRADAY_HRV_TABLE, schema.INTRADAY_HRV_SCHEMA)]),
+    Resource(fitbit_classes.Spo2Intraday, "intraday",
+             [(schema.INTRADAY_SPO2_TABLE, schema.INTRADAY_SPO2_SCHEMA)]),
+    Resource(fitbit_classes.StepsIntraday, "intraday",
+             [(schema.INTRADAY_STEPS_TABLE, schema.INTRADAY_STEPS_SCHEMA)]),
+    Resource(fitbit_classes.FloorsIntraday, "intraday",
+             [(schema.INTRADAY_FLOORS_TABLE, schema.INTRADAY_FLOORS_SCHEMA)]),
+    Resource(fitbit_classes.DistanceIntraday, "intraday",
+             [(schema.INTRADAY_DISTANCE_TABLE, schema.INTRADAY_DISTANCE_SCHEMA)]),
+    Resource(fitbit_classes.ElevationIntraday, "intraday",
+             [(schema.INTRADAY_ELEVATION_TABLE, schema.INTRADAY_ELEVATION_SCHEMA)]),
+    Resource(fitbit_classes.CaloriesIntraday, "intraday",
+             [(schema.INTRADAY_CALORIES_TABLE, schema.INTRADAY_CALORIES_SCHEMA)]),
+    Resource(fitbit_classes.HeartRateIntraday, "intraday",
+             [(schema.INTRADAY_HEART_RATE_TABLE, schema.INTRADAY_HEART_RATE_SCHEMA)]),
+    Resource(fitbit_classes.BreathingRateIntraday, "intraday",
+             [(schema.INTRADAY_BREATHING_RATE_TABLE, schema.INTRADAY_BREATHING_RATE_SCHEMA)]),
+    Resource(fitbit_classes.DailyActivitySummary, "daily",
+             [(schema.ACTIVITY_SUMMARY_TABLE, schema.ACTIVITY_SUMMARY_SCHEMA)]),
+    Resource(fitbit_classes.ActivityLogs, "daily",
+             [(schema.ACTIVITY_LOGS_TABLE, schema.ACTIVITY_LOGS_SCHEMA)]),
+    Resource(fitbit_classes.NutritionSummary, "daily",
+             [(schema.NUTRITION_SUMMARY_TABLE, schema.NUTRITION_SUMMARY_SCHEMA)]),
+    Resource(fitbit_classes.NutritionLogs, "daily",
+             [(schema.NUTRITION_LOGS_TABLE, schema.NUTRITION_LOGS_SCHEMA)]),
+    Resource(fitbit_classes.BodyWeight, "daily",
+             [(schema.BODY_WEIGHT_TABLE, schema.BODY_WEIGHT_SCHEMA)]),
+    Resource(fitbit_classes.Devices, "snapshot",
+             [(schema.DEVICES_TABLE, schema.DEVICES_SCHEMA)], refresh_days=1),
+    Resource(fitbit_classes.ActivityGoals, "snapshot",
+             [(schema.ACTIVITY_GOALS_TABLE, schema.ACTIVITY_GOALS_SCHEMA)], refresh_days=7),
+    Resource(fitbit_classes.NutritionGoals, "snapshot",
+             [(schema.NUTRITION_GOALS_TABLE, schema.NUTRITION_GOALS_SCHEMA)], refresh_days=7),
+    Resource(fitbit_classes.Badges, "snapshot",
+             [(schema.BADGES_TABLE, schema.BADGES_SCHEMA)], refresh_days=7),
+    Resource(fitbit_classes.Social, "snapshot",
+             [(schema.SOCIAL_TABLE, schema.SOCIAL_SCHEMA)], refresh_days=7),
+]
+
+BY_NAME = {resource.name: resource for resource in RESOURCES}
+
+
+def select(*groups):
+    """the resources of ``groups``, in registry order"""
+    return [resource for resource in RESOURCES if resource.group in groups]
+
+
+def requests(days, user="-"):
+    """``{(url, first, last): [resource]}`` fetching ``days``, ``{resource: (start, end)}``
+
+    resources sharing a url are listed under a single request.  requests
+    come in registry order, and in day order for each resource.
+    """
+    fetches = {}
+    for resource, (start, end) in days.items():
+        for first, last in resource.date_ranges(start, end):
+            fetches.setdefault((resource.url(user, first, last), first, last), []).append(resource)
+    return fetches
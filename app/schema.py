@@ -994,4 +994,59 @@ INTRADAY_BREATHING_RATE_SCHEMA = [
         "type": "Float",
         "description": "Breathing rate while in sleep stage",
     }
-]
\ No newline at end of file
+]
+
+# natural key of each table.  with the "merge" write mode, rows loaded
+# again for the same key replace the existing ones instead of being
+# appended next to them.
+MERGE_KEYS = {
+    INTRADAY_HEART_RATE_TABLE: ["id", "time"],
+    INTRADAY_HRV_TABLE: ["id", "time"],
+    INTRADAY_SPO2_TABLE: ["id", "time"],
+    INTRADAY_STEPS_TABLE: ["id", "time"],
+    INTRADAY_FLOORS_TABLE: ["id", "time"],
+    INTRADAY_DISTANCE_TABLE: ["id", "time"],
+    INTRADAY_ELEVATION_TABLE: ["id", "time"],
+    INTRADAY_CALORIES_TABLE: ["id", "time"],
+    INTRADAY_BREATHING_RATE_TABLE: ["id", "time", "stage"],
+    SLEEP_STAGES_TABLE: ["id", "log_id", "time"],
+    SLEEP_RECORDS_TABLE: ["id", "log_id"],
+    ACTIVITY_SUMMARY_TABLE: ["id", "date"],
+    ACTIVITY_LOGS_TABLE: ["id", "log_id"],
+    ACTIVITY_GOALS_TABLE: ["id", "date"],
+    BODY_WEIGHT_TABLE: ["id", "log_id"],
+    NUTRITION_SUMMARY_TABLE: ["id", "date"],
+    NUTRITION_LOGS_TABLE: ["id", "log_id"],
+    NUTRITION_GOALS_TABLE: ["id", "date"],
+    DEVICES_TABLE: ["id", "date", "device_version"],
+    BADGES_TABLE: ["id", "date", "badge_type", "value"],
+    SOCIAL_TABLE: ["id", "date", "friend_id"],
+}
+
+# column each table is partitioned on, by day
+PARTITION_FIELDS = {
+    INTRADAY_HEART_RATE_TABLE: "time",
+    INTRADAY_HRV_TABLE: "time",
+    INTRADAY_SPO2_TABLE: "time",
+    INTRADAY_STEPS_TABLE: "time",
+    INTRADAY_FLOORS_TABLE: "time",
+    INTRADAY_DISTANCE_TABLE: "time",
+    INTRADAY_ELEVATION_TABLE: "time",
+    INTRADAY_CALORIES_TABLE: "time",
+    INTRADAY_BREATHING_RATE_TABLE: "time",
+    SLEEP_STAGES_TABLE: "time",
+    SLEEP_RECORDS_TABLE: "date_of_sleep",
+    ACTIVITY_GOALS_TABLE: "date",
+    ACTIVITY_LOGS_TABLE: "date",
+    ACTIVITY_SUMMARY_TABLE: "date",
+    BADGES_TABLE: "date",
+    BODY_WEIGHT_TABLE: "date",
+    DEVICES_TABLE: "date",
+    NUTRITION_GOALS_TABLE: "date",
+    NUTRITION_LOGS_TABLE: "date",
+    NUTRITION_SUMMARY_TABLE: "date",
+    SOCIAL_TABLE: "date",
+}
+
+# columns each table is clustered on
+CLUSTER_FIELDS = {table: ["id"] for table in PARTITION_FIELDS}
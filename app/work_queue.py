@@ -0,0 +1,202 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""queue of ingestion tasks, for spreading ingestion over many instances
+
+The `/dispatch` route splits an ingestion run into tasks, one per shard
+of `DISPATCH_USERS_PER_TASK` users covering every resource and all the
+days of the run, and puts them on a queue.  Each task is
+then processed by a call to the `/work` route, so the work is shared by all
+running instances and a failed task is retried on its own.
+
+A task is a json-able dict::
+
+    {"users": ["user@domain.com"], "resources": ["SleepLog"],
+     "start": "2022-03-01", "end": "2022-03-07", "incremental": false}
+
+Two queues are provided:
+
+    * ``CloudTasksQueue``: a Cloud Tasks queue.  each task is delivered as a
+        POST of the task to the `/work` route, and Cloud Tasks retries it
+        according to the queue's retry configuration.
+    * ``SqliteQueue``: a local stand-in, for development and tests.  tasks
+        are kept in a sqlite database and `/work` claims the next one.  a
+        failed task, or one whose lease expired, is retried up to
+        `WORK_MAX_ATTEMPTS` times.
+
+Example::
+
+    queue = open_queue("sqlite:///tmp/work.db")
+    queue.put({"users": ["user@domain.com"], "resources": ["SleepLog"], ...})
+    task_id, task = queue.claim()
+    ...
+    queue.done(task_id)
+
+Configuration:
+
+    * `WORK_QUEUE`: the queue used by `/dispatch`, either a Cloud Tasks
+        queue (`projects/<project>/locations/<location>/queues/<queue>`) or
+        `sqlite://<path>` (e.g. `sqlite:///tmp/work.db`).  defaults to an
+        in-memory sqlite queue, `sqlite://`, which belongs to a single
+        process: with several gunicorn workers (`WEB_CONCURRENCY`) `/work`
+        may reach another worker than `/dispatch`, so a path is required.
+    * `WORKER_URL`: url of the `/work` route that Cloud Tasks calls, e.g.
+        `https://<service>.run.app/work`.
+    * `WORKER_SERVICE_ACCOUNT`: optional, service account whose oidc token
+        Cloud Tasks sends to `WORKER_URL`.
+    * `WORK_MAX_ATTEMPTS`: optional, attempts for a task on the sqlite
+        queue (default 5).
+    * `WORK_LEASE_SECONDS`: optional, a task claimed from the sqlite queue
+        and neither done nor failed within this time is handed out again
+        (default 1800).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+work_queue_uri = os.environ.get("WORK_QUEUE", "sqlite://")
+worker_url = os.environ.get("WORKER_URL")
+worker_service_account = os.environ.get("WORKER_SERVICE_ACCOUNT")
+max_attempts = int(os.environ.get("WORK_MAX_ATTEMPTS", 5))
+lease_seconds = int(os.environ.get("WORK_LEASE_SECONDS", 1800))
+web_concurrency = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# longest a Cloud Tasks http task may run, tasks hold many users
+DISPATCH_DEADLINE_SECONDS = 1800
+
+
+class SqliteQueue:
+    """work queue in a sqlite database, ``":memory:"`` keeps it in process"""
+
+    def __init__(self, path=":memory:", max_attempts=max_attempts, lease_seconds=lease_seconds):
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            """create table if not exists tasks (
+                id integer primary key autoincrement,
+                task text not null,
+                status text not null default 'queued',
+                attempts integer not null default 0,
+                available_at real not null default 0,
+                error text
+            )"""
+        )
+
+    def put(self, task):
+        with self._lock:
+            self._db.execute("insert into tasks (task) values (?)", (json.dumps(task),))
+
+    def claim(self):
+        """take the next task, returning ``(task_id, task)``, or None if there is none
+
+        a task whose lease expired after its last attempt, e.g. because the
+        worker crashed on it, is marked failed instead of handed out again.
+        """
+        now = time.time()
+        with self._lock:
+            while True:
+                row = self._db.execute(
+                    """select id, task, status, attempts from tasks
+                       where status in ('queued', 'claimed') and available_at <= ?
+                       order by id limit 1""",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[2] != "claimed" or row[3] < self.max_attempts:
+                    break
+                log.error("task %d timed out %d times, giving up", row[0], row[3])
+                self._db.execute(
+                    "update tasks set status = 'failed', error = 'lease expired' where id = ?", (row[0],)
+                )
+            self._db.execute(
+                """update tasks set status = 'claimed', attempts = attempts + 1, available_at = ?
+                   where id = ?""",
+                (now + self.lease_seconds, row[0]),
+            )
+        return row[0], json.loads(row[1])
+
+    def done(self, task_id):
+        with self._lock:
+            self._db.execute("update tasks set status = 'done' where id = ?", (task_id,))
+
+    def fail(self, task_id, error):
+        """retry the task later, or give up on it once it used all its attempts"""
+        with self._lock:
+            (attempts,) = self._db.execute(
+                "select attempts from tasks where id = ?", (task_id,)
+            ).fetchone()
+            if attempts >= self.max_attempts:
+                log.error("task %d failed %d times, giving up: %s", task_id, attempts, error)
+                self._db.execute(
+                    "update tasks set status = 'failed', error = ? where id = ?", (error, task_id)
+                )
+            else:
+                self._db.execute(
+                    "update tasks set status = 'queued', error = ?, available_at = ? where id = ?",
+                    (error, time.time() + 2 ** attempts, task_id),
+                )
+
+    def counts(self):
+        """number of tasks in each status"""
+        with self._lock:
+            return dict(self._db.execute("select status, count(*) from tasks group by status"))
+
+
+class CloudTasksQueue:
+    """Cloud Tasks queue delivering each task to ``url`` as a json POST"""
+
+    def __init__(self, queue_path, url, service_account=None):
+        from google.cloud import tasks_v2
+
+        self.client = tasks_v2.CloudTasksClient()
+        self.queue_path = queue_path
+        self.url = url
+        self.service_account = service_account
+
+    def put(self, task):
+        http_request = {
+            "http_method": "POST",
+            "url": self.url,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(task).encode("utf-8"),
+        }
+        if self.service_account:
+            http_request["oidc_token"] = {"service_account_email": self.service_account}
+
+        self.client.create_task(parent=self.queue_path, task={
+            "http_request": http_request,
+            "dispatch_deadline": {"seconds": DISPATCH_DEADLINE_SECONDS},
+        })
+
+
+def open_queue(uri):
+    """queue for a `sqlite://` uri or a Cloud Tasks queue path"""
+    if uri.startswith("sqlite://"):
+        path = uri[len("sqlite://"):]
+        if not path and web_concurrency > 1:
+            raise ValueError("WORK_QUEUE needs a sqlite path or a Cloud Tasks queue when WEB_CONCURRENCY > 1")
+        return SqliteQueue(path or ":memory:")
+    return CloudTasksQueue(uri, worker_url, worker_service_account)
+
+
+# queue used by the dispatch and work routes
+queue = open_queue(work_queue_uri)
@@ -0,0 +1,397 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""local stand-ins for fitbit, firestore and bigquery, for load tests
+
+    * ``FakeFitbitServer``: http server answering the fitbit web api urls
+        used by ingestion with payloads from ``benchmarks.payloads``, after
+        a random delay, with fitbit's rate limit headers.  the user is
+        the bearer token, and tokens can be refreshed at `/oauth2/token`.
+    * ``MemoryFirestore``: in-memory firestore client, with the part of
+        the api ``firestore_storage`` uses.
+    * ``FakeBigQuery``: bigquery client whose load jobs read the parquet
+        file and only count its rows, and whose queries do nothing.
+
+each of them counts the calls it gets, in ``counts``.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+
+from . import payloads
+
+LIMIT_HEADER = "Fitbit-Rate-Limit-Limit"
+REMAINING_HEADER = "Fitbit-Rate-Limit-Remaining"
+RESET_HEADER = "Fitbit-Rate-Limit-Reset"
+
+# (resource, url pattern), the dates are the first and optional last day
+_DATES = r"(?P<first>\d{4}-\d\d-\d\d)(?:/(?P<last>\d{4}-\d\d-\d\d))?"
+ROUTES = [
+    ("devices", re.compile(r"/1/user/-/devices\.json$")),
+    ("heart_rate", re.compile(r"/1\.2/user/-/activities/heart/date/" + _DATES + r"/(?P<resolution>1d|1sec|1min)\.json$")),
+    ("activity", re.compile(r"/1/user/-/activities/(?P<type>\w+)/date/" + _DATES + r"/1d/\w+\.json$")),
+    ("hrv", re.compile(r"/1/user/-/hrv/date/" + _DATES + r"/all\.json$")),
+    ("spo2", re.compile(r"/1/user/-/spo2/date/" + _DATES + r"/all\.json$")),
+    ("breathing_rate", re.compile(r"/1/user/-/br/date/" + _DATES + r"/all\.json$")),
+    ("sleep", re.compile(r"/1\.2/user/-/sleep/date/" + _DATES + r"\.json$")),
+    ("daily_activity", re.compile(r"/1/user/-/activities/date/" + _DATES + r"\.json$")),
+    ("nutrition", re.compile(r"/1/user/-/foods/log/date/" + _DATES + r"\.json$")),
+    ("body_weight", re.compile(r"/1/user/-/body/log/weight/date/" + _DATES + r"\.json$")),
+    ("activity_goals", re.compile(r"/1/user/-/activities/goals/daily\.json$")),
+    ("nutrition_goals", re.compile(r"/1/user/-/foods/log/goal\.json$")),
+    ("badges", re.compile(r"/1/user/-/badges\.json$")),
+    ("friends", re.compile(r"/1\.1/user/-/friends\.json$")),
+]
+
+
+def _span(first, last):
+    return (date.fromisoformat(last or first) - date.fromisoformat(first)).days + 1
+
+
+@lru_cache(maxsize=1024)
+def _payload(resource, first, last, detail):
+    """response body for a url, the same for every user so it is built once"""
+    if resource == "devices":
+        return json.dumps([{"id": "1", "lastSyncTime": f"{date.today()}T06:00:00.000"}])
+    if resource == "heart_rate":
+        return json.dumps(payloads.heart_rate(first, interval=1 if detail == "1sec" else 60))
+    if resource == "activity":
+        return json.dumps(payloads.activity(detail, first))
+    generate = getattr(payloads, resource)
+    if first is None:
+        return json.dumps(generate())
+    return json.dumps(generate(first, _span(first, last)))
+
+
+class FakeFitbitServer:
+    """fitbit web api stand-in on ``url``, serving from a background thread
+
+    Args:
+        latency: mean delay of a response in seconds, each response waits
+            between half and one and a half times this.
+        rate_limit: requests per user allowed in ``rate_window`` seconds,
+            further requests get a 429 until the window ends.
+    """
+
+    def __init__(self, latency=0.05, rate_limit=150, rate_window=3600, port=0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _spend(self, user):
+        """count a request against ``user``'s budget, returning (remaining, reset seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budgets.get(user)
+            if budget is None or now >= budget["reset_at"]:
+                budget = self._budgets[user] = {"used": 0, "reset_at": now + self.rate_window}
+            budget["used"] += 1
+            return self.rate_limit - budget["used"], int(budget["reset_at"] - now) + 1
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, headers=()):
+                body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+                if self.path.split("?")[0] != "/oauth2/token" or "refresh_token" not in form:
+                    self._send(404, "{}")
+                    return
+
+                server._count("token")
+                # the user is the refresh token, and the access token
+                user = form["refresh_token"][0]
+                self._send(200, json.dumps({
+                    "access_token": user, "refresh_token": user, "expires_in": 28800,
+                    "token_type": "Bearer", "user_id": user,
+                }))
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                user = self.headers.get("Authorization", "").replace("Bearer ", "")
+                for resource, pattern in ROUTES:
+                    match = pattern.match(path)
+                    if match:
+                        break
+                else:
+                    server._count("not_found")
+                    self._send(404, json.dumps({"errors": [{"message": path}]}))
+                    return
+
+                time.sleep(random.uniform(0.5, 1.5) * server.latency)
+                remaining, reset = server._spend(user)
+                headers = [
+                    (LIMIT_HEADER, str(server.rate_limit)),
+                    (REMAINING_HEADER, str(max(remaining, 0))),
+                    (RESET_HEADER, str(reset)),
+                ]
+                if remaining < 0:
+                    server._count("429")
+                    self._send(429, json.dumps({"errors": [{"errorType": "system"}]}), headers)
+                    return
+
+                server._count(resource)
+                groups = match.groupdict()
+                body = _payload(resource, groups.get("first"), groups.get("last"),
+                                groups.get("resolution") or groups.get("type"))
+                self._send(200, body, headers)
+
+        return Handler
+
+
+def fitbit_token(user, expires_in=28800):
+    """token document for ``user`` as the fake fitbit server accepts it"""
+    return {
+        "access_token": user,
+        "refresh_token": user,
+        "token_type": "Bearer",
+        "expires_in": expires_in,
+        "expires_at": datetime.now(timezone.utc).timestamp() + expires_in,
+        "user_id": user,
+    }
+
+
+class _Snapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _Document:
+    def __init__(self, db, path, doc_id):
+        self._db = db
+        self._path = path
+        self.id = doc_id
+
+    def collection(self, name):
+        return _Collection(self._db, self._path + (self.id, name))
+
+    def get(self):
+        self._db.counts["read"] += 1
+        return _Snapshot(self.id, self._db.docs(self._path).get(self.id))
+
+    def set(self, data, merge=False):
+        self._db.counts["write"] += 1
+        with self._db.lock:
+            docs = self._db.docs(self._path)
+            if merge and self.id in docs:
+                docs[self.id] = dict(docs[self.id], **data)
+            else:
+                docs[self.id] = dict(data)
+
+    def delete(self):
+        self._db.counts["delete"] += 1
+        with self._db.lock:
+            self._db.docs(self._path).pop(self.id, None)
+
+
+class _Query:
+    def __init__(self, collection, filters=(), limit=None, after=None):
+        self._collection = collection
+        self._filters = filters
+        self._limit = limit
+        self._after = after
+
+    def _with(self, **changes):
+        query = _Query(self._collection, self._filters, self._limit, self._after)
+        query.__dict__.update({f"_{key}": value for key, value in changes.items()})
+        return query
+
+    def select(self, fields):
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def where(self, field, op, value):
+        if op != "==":
+            raise NotImplementedError(op)
+        return self._with(filters=self._filters + ((field, value),))
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def start_after(self, snapshot):
+        return self._with(after=snapshot.id)
+
+    def stream(self):
+        db = self._collection._db
+        with db.lock:
+            docs = sorted(db.docs(self._collection._path).items())
+        matches = [
+            _Snapshot(doc_id, data) for doc_id, data in docs
+            if (self._after is None or doc_id > self._after)
+            and all(data.get(field) == value for field, value in self._filters)
+        ]
+        matches = matches[:self._limit]
+        db.counts["read"] += max(len(matches), 1)
+        return iter(matches)
+
+
+class _Collection(_Query):
+    def __init__(self, db, path):
+        super().__init__(self)
+        self._db = db
+        self._path = path
+
+    def document(self, doc_id):
+        return _Document(self._db, self._path, doc_id)
+
+
+class _Batch:
+    def __init__(self):
+        self._writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._writes.append((doc_ref, data, merge))
+
+    def commit(self):
+        for doc_ref, data, merge in self._writes:
+            doc_ref.set(data, merge=merge)
+        self._writes = []
+
+
+class MemoryFirestore:
+    """in-memory ``firestore.client()``, install it before importing ``app``::
+
+        firebase_admin.initialize_app = lambda *args, **kwargs: None
+        firestore.client = lambda *args, **kwargs: MemoryFirestore()
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.counts = Counter()
+        self._collections = {}
+
+    def docs(self, path):
+        with self.lock:
+            return self._collections.setdefault(path, {})
+
+    def collection(self, name):
+        return _Collection(self, (name,))
+
+    def batch(self):
+        return _Batch()
+
+
+class _Job:
+    def result(self):
+        return self
+
+
+class FakeBigQuery:
+    """bigquery client keeping table definitions, and counting loaded rows and queries"""
+
+    def __init__(self, project="load-test"):
+        self.project = project
+        self.counts = Counter()
+        self.rows = Counter()
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def _table_id(self, table):
+        table_id = table if isinstance(table, str) else str(getattr(table, "reference", table))
+        table_id = table_id.replace(":", ".")
+        return table_id if table_id.count(".") == 2 else f"{self.project}.{table_id}"
+
+    def _count(self, key, rows=0, table=None):
+        with self._lock:
+            self.counts[key] += 1
+            if table:
+                self.rows[table] += rows
+
+    def get_table(self, table):
+        self._count("get_table")
+        try:
+            return self.tables[self._table_id(table)]
+        except KeyError:
+            raise NotFound(self._table_id(table))
+
+    def create_table(self, table, exists_ok=False):
+        self._count("create_table")
+        return self.tables.setdefault(self._table_id(table), table)
+
+    def update_table(self, table, fields):
+        self._count("update_table")
+        return table
+
+    def delete_table(self, table, not_found_ok=False):
+        self._count("delete_table")
+        self.tables.pop(self._table_id(table), None)
+
+    def create_dataset(self, dataset, exists_ok=False):
+        self._count("create_dataset")
+
+    def load_table_from_file(self, file, destination, job_config=None):
+        rows = pq.read_metadata(file).num_rows
+        table = re.sub(r"_staging_\w+$", "", self._table_id(destination).split(".")[-1])
+        self._count("load_job", rows, table)
+        return _Job()
+
+    def query(self, query, job_config=None):
+        self._count("query")
+        return _Job()
@@ -0,0 +1,155 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""end-to-end load test of the ingestion routes, without fitbit or gcp
+
+starts a ``FakeFitbitServer``, points the app at it with `FITBIT_API_URL`,
+replaces firestore with ``MemoryFirestore`` holding tokens for ``--users``
+users, and bigquery with ``FakeBigQuery``.  then calls a route for
+``--days`` days through flask's test client and reports the wall time,
+the fitbit api calls, the bigquery load jobs and queries, the firestore
+operations and the memory used.
+
+the fakes are installed before ``app`` is imported, so this must run in
+its own process.
+
+Usage::
+
+    python -m benchmarks.ingest_load --users 20 --days 7
+    python -m benchmarks.ingest_load --route fitbit_sleep_scope --latency 0.2
+    python -m benchmarks.ingest_load --route fitbit_daily_scope --days 3
+    python -m benchmarks.ingest_load --async --concurrency 32 --json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from datetime import date, timedelta
+
+import firebase_admin
+from firebase_admin import firestore
+from google.cloud import bigquery
+
+from .fakes import FakeBigQuery, FakeFitbitServer, MemoryFirestore, fitbit_token
+
+
+def _max_rss_mb():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _install_fakes(server, async_ingest):
+    """point the app at the fakes, this has to happen before it is imported"""
+    memory_firestore = MemoryFirestore()
+    fake_bigquery = FakeBigQuery()
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+    firestore.client = lambda *args, **kwargs: memory_firestore
+    bigquery.Client = lambda *args, **kwargs: fake_bigquery
+
+    os.environ.update({
+        "FITBIT_API_URL": server.url,
+        "FITBIT_OAUTH_CLIENT_ID": "load-test",
+        "FITBIT_OAUTH_CLIENT_SECRET": "load-test",
+        "GOOGLE_CLOUD_PROJECT": fake_bigquery.project,
+        "BIGQUERY_DATASET": "fitbit",
+        # the fake server only speaks http
+        "OAUTHLIB_INSECURE_TRANSPORT": "1",
+    })
+    os.environ.pop("RAW_ARCHIVE_URI", None)
+    if async_ingest:
+        os.environ["INGEST_ASYNC"] = "1"
+    return memory_firestore, fake_bigquery
+
+
+def run(args):
+    with FakeFitbitServer(args.latency, args.rate_limit, args.rate_window) as server:
+        memory_firestore, fake_bigquery = _install_fakes(server, args.async_ingest)
+
+        from app.fitbit_auth import fitbit_bp
+        from app.main import app
+
+        for n in range(args.users):
+            fitbit_bp.storage.save(f"user{n:05d}@example.com", fitbit_token(f"user{n:05d}@example.com"))
+        memory_firestore.counts.clear()
+
+        end = date.today() - timedelta(days=1)
+        start = end - timedelta(days=args.days - 1)
+        query = {"start": start.isoformat(), "end": end.isoformat()}
+        if args.concurrency:
+            query["concurrency"] = args.concurrency
+
+        rss_before = _max_rss_mb()
+        started = time.monotonic()
+        resp = app.test_client().get(f"/{args.route}", query_string=query)
+        elapsed = time.monotonic() - started
+
+        api_calls = sum(count for key, count in server.counts.items() if key not in ("token", "not_found"))
+        return {
+            "route": args.route,
+            "status": resp.status_code,
+            "response": resp.get_data(as_text=True)[:200],
+            "users": args.users,
+            "days": args.days,
+            "seconds": round(elapsed, 3),
+            "user_days_per_second": round(args.users * args.days / elapsed, 2),
+            "api_calls": api_calls,
+            "api_calls_by_resource": dict(server.counts),
+            "load_jobs": fake_bigquery.counts["load_job"],
+            "queries": fake_bigquery.counts["query"],
+            "rows_loaded": dict(fake_bigquery.rows),
+            "firestore": dict(memory_firestore.counts),
+            "max_rss_mb": round(_max_rss_mb(), 1),
+            "rss_growth_mb": round(_max_rss_mb() - rss_before, 1),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--route", default="fitbit_intraday_scope",
+                        help="ingestion route to call (default fitbit_intraday_scope)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, help="passed as ?concurrency=")
+    parser.add_argument("--async", dest="async_ingest", action="store_true",
+                        help="set INGEST_ASYNC, for the asyncio intraday path")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="mean latency of the fake fitbit api, in seconds (default 0.05)")
+    parser.add_argument("--rate-limit", type=int, default=150,
+                        help="requests per user and window (default 150, as fitbit)")
+    parser.add_argument("--rate-window", type=int, default=3600,
+                        help="seconds before a user's budget is renewed (default 3600)")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0 if results["status"] == 200 else 1
+
+    print(f"{results['route']}: {results['status']} {results['response']}")
+    print(f"{results['users']} users x {results['days']} days in {results['seconds']:.2f}s "
+          f"({results['user_days_per_second']:.1f} user-days/s)")
+    print(f"fitbit api calls: {results['api_calls']} {results['api_calls_by_resource']}")
+    print(f"bigquery: {results['load_jobs']} load jobs, {results['queries']} queries, "
+          f"rows {results['rows_loaded']}")
+    print(f"firestore: {results['firestore']}")
+    print(f"memory: max rss {results['max_rss_mb']:.0f} MB, "
+          f"grew {results['rss_growth_mb']:.0f} MB during the run")
+    return 0 if results["status"] == 200 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
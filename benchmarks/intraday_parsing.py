@@ -0,0 +1,71 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""compare the intraday fast path against pd.json_normalize + normalize
+
+checks that both produce the same dataframe for a full day of minute data,
+then times them.
+
+Usage::
+
+    python -m benchmarks.intraday_parsing
+"""
+import random
+import timeit
+
+import pandas as pd
+
+from app.fitbit_classes.util import intraday_dataframe, normalize
+
+DATE = "2022-03-01"
+
+
+def _minutes(value):
+    return [
+        {"time": f"{m // 60:02d}:{m % 60:02d}:00", "value": value()}
+        for m in range(1440)
+    ]
+
+
+def _calories():
+    return [
+        dict(record, level=random.randint(0, 3), mets=random.randint(10, 60))
+        for record in _minutes(lambda: round(random.uniform(1, 10), 2))
+    ]
+
+
+DATASETS = {
+    "heart_rate": _minutes(lambda: random.randint(50, 180)),
+    "steps": _minutes(lambda: random.randint(0, 120)),
+    "calories": _calories(),
+}
+
+
+def legacy(dataset):
+    df = pd.json_normalize(dataset)
+    return normalize(df, DATE, df["time"])
+
+
+def main(number=50):
+    for name, dataset in DATASETS.items():
+        pd.testing.assert_frame_equal(legacy(dataset), intraday_dataframe(DATE, dataset))
+
+        slow = timeit.timeit(lambda: legacy(dataset), number=number) / number
+        fast = timeit.timeit(lambda: intraday_dataframe(DATE, dataset), number=number) / number
+        print(f"{name:12s} legacy {slow * 1000:8.2f} ms   fast path {fast * 1000:8.2f} ms   "
+              f"speedup {slow / fast:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""memory held by the parsed dataframes, before and after compaction
+
+for each case of ``benchmarks.parsers`` it reports the bytes of the
+parsed ``.dataframe``, with the user ``id`` column the ingestion adds:
+
+    * `object`: the frame as parsed, with python strings and int64, and
+        an object `id` column as it was loaded before.
+    * `compact`: the frame with the dtypes of its ``SCHEMA``, see
+        ``fitbit_classes.util.compact``, and a category `id` column.
+    * `arrow`: the arrow table handed to ``BigQueryWriter.write``, see
+        ``bigquery_writer.to_arrow``.
+
+the sizes are for ``--days`` days of each case, as buffered by a run
+ingesting that many user-days.
+
+Usage::
+
+    python -m benchmarks.memory [--only heart_rate] [--days 100]
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from app.bigquery_writer import to_arrow
+
+from .parsers import CASES
+
+USER = "someone@example.com"
+
+
+def _frame_bytes(df, user_id):
+    return int(df.memory_usage(deep=True).sum() + user_id.memory_usage(deep=True))
+
+
+def run_case(cls, payload):
+    parsed = cls(payload)
+    raw = parsed._df.copy()
+    rows = len(raw)
+    before = _frame_bytes(raw, pd.Series([USER] * rows, dtype=object))
+
+    df = parsed.dataframe
+    after = _frame_bytes(df, pd.Series([USER] * rows, dtype="category"))
+    arrow_table, _ = to_arrow(df, cls.SCHEMA, {"id": USER})
+    return {
+        "rows": rows,
+        "object_bytes": before,
+        "compact_bytes": after,
+        "arrow_bytes": arrow_table.nbytes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", help="only run the cases whose name contains this")
+    parser.add_argument("--days", type=int, default=1, help="user-days buffered (default 1)")
+    args = parser.parse_args(argv)
+
+    total = {"object_bytes": 0, "compact_bytes": 0, "arrow_bytes": 0}
+    scale = args.days / 2 ** 20
+    print(f"{'case':22s} {'rows':>8s} {'object':>11s} {'compact':>11s} {'arrow':>11s} {'saved':>7s}")
+    for name, cls, payload in CASES:
+        if args.only and args.only not in name:
+            continue
+        result = run_case(cls, payload())
+        for key in total:
+            total[key] += result[key]
+        print(f"{name:22s} {result['rows']:8d} {result['object_bytes'] * scale:8.1f} MB "
+              f"{result['compact_bytes'] * scale:8.1f} MB {result['arrow_bytes'] * scale:8.1f} MB "
+              f"{1 - result['compact_bytes'] / result['object_bytes']:6.0%}")
+
+    if total["object_bytes"]:
+        print(f"{'total':22s} {'':8s} {total['object_bytes'] * scale:8.1f} MB "
+              f"{total['compact_bytes'] * scale:8.1f} MB {total['arrow_bytes'] * scale:8.1f} MB "
+              f"{1 - total['compact_bytes'] / total['object_bytes']:6.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""time the fitbit_classes parsers on synthetic payloads
+
+every class is parsed from a full day of data (1440 minutes of heart rate
+and activities, 86400 seconds of heart rate, 288 hrv readings, a night of
+spo2 and sleep stages) and, for the classes with a date range endpoint,
+from a full range request of ``MAX_RANGE_DAYS`` days.  no network or gcp
+access is needed, the payloads come from ``benchmarks.payloads``.
+
+for each case it reports the time to construct the class and to get the
+first ``.dataframe`` of a new instance, which compacts it to the dtypes of
+its schema, the rows parsed per second, and the peak memory allocated
+while parsing.
+
+results can be saved as json and compared with a later run, which exits
+with status 1 if a case got slower (or used more memory) than the
+tolerance allows.
+
+Usage::
+
+    python -m benchmarks.parsers [--number 20] [--only sleep]
+    python -m benchmarks.parsers --save baseline.json
+    python -m benchmarks.parsers --compare baseline.json [--tolerance 0.25]
+"""
+import argparse
+import json
+import sys
+import time
+import timeit
+import tracemalloc
+
+from app.fitbit_classes import (
+    BreathingRateIntraday,
+    CaloriesIntraday,
+    DistanceIntraday,
+    ElevationIntraday,
+    FloorsIntraday,
+    HeartRateIntraday,
+    HrvIntraday,
+    SleepLog,
+    Spo2Intraday,
+    StepsIntraday,
+)
+
+from . import payloads
+
+DATE = "2022-03-01"
+
+# (name, class, payload)
+CASES = [
+    ("heart_rate 1min", HeartRateIntraday, lambda: payloads.heart_rate(DATE)),
+    ("heart_rate 1sec", HeartRateIntraday, lambda: payloads.heart_rate(DATE, interval=1)),
+    ("steps", StepsIntraday, lambda: payloads.activity("steps", DATE)),
+    ("floors", FloorsIntraday, lambda: payloads.activity("floors", DATE)),
+    ("distance", DistanceIntraday, lambda: payloads.activity("distance", DATE)),
+    ("elevation", ElevationIntraday, lambda: payloads.activity("elevation", DATE)),
+    ("calories", CaloriesIntraday, lambda: payloads.activity("calories", DATE)),
+    ("hrv", HrvIntraday, lambda: payloads.hrv(DATE)),
+    (f"hrv {HrvIntraday.MAX_RANGE_DAYS}d", HrvIntraday,
+     lambda: payloads.hrv(DATE, HrvIntraday.MAX_RANGE_DAYS)),
+    ("spo2", Spo2Intraday, lambda: payloads.spo2(DATE)),
+    (f"spo2 {Spo2Intraday.MAX_RANGE_DAYS}d", Spo2Intraday,
+     lambda: payloads.spo2(DATE, Spo2Intraday.MAX_RANGE_DAYS)),
+    ("breathing_rate", BreathingRateIntraday, lambda: payloads.breathing_rate(DATE)),
+    (f"breathing_rate {BreathingRateIntraday.MAX_RANGE_DAYS}d", BreathingRateIntraday,
+     lambda: payloads.breathing_rate(DATE, BreathingRateIntraday.MAX_RANGE_DAYS)),
+    ("sleep", SleepLog, lambda: payloads.sleep(DATE)),
+    (f"sleep {SleepLog.MAX_RANGE_DAYS}d", SleepLog,
+     lambda: payloads.sleep(DATE, SleepLog.MAX_RANGE_DAYS)),
+]
+
+
+def _peak_memory(cls, payload):
+    """peak bytes allocated while parsing ``payload``, the payload itself excluded"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        cls(payload).dataframe
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def _first_dataframe(cls, payload, number):
+    """fastest of ``number`` first ``.dataframe`` of a new instance, later ones are cached"""
+    times = []
+    for _ in range(number):
+        parsed = cls(payload)
+        started = time.perf_counter()
+        parsed.dataframe
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def run_case(cls, payload, number):
+    rows = len(cls(payload).dataframe)
+
+    construct = min(timeit.repeat(lambda: cls(payload), number=number, repeat=3)) / number
+    dataframe = _first_dataframe(cls, payload, max(number, 3))
+    return {
+        "rows": rows,
+        "construct_ms": construct * 1000,
+        "dataframe_ms": dataframe * 1000,
+        "rows_per_second": rows / (construct + dataframe),
+        "peak_mb": _peak_memory(cls, payload) / 2 ** 20,
+    }
+
+
+def _regressions(results, baseline, tolerance):
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in ("construct_ms", "dataframe_ms", "peak_mb"):
+            if result[metric] > before[metric] * (1 + tolerance):
+                yield f"{name}: {metric} {before[metric]:.2f} -> {result[metric]:.2f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=10, help="parses per timing")
+    parser.add_argument("--only", help="only run the cases whose name contains this")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--compare", help="json file of earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown or memory growth when comparing (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'case':22s} {'rows':>8s} {'construct':>12s} {'dataframe':>12s} "
+          f"{'rows/s':>12s} {'peak':>10s}")
+    for name, cls, payload in CASES:
+        if args.only and args.only not in name:
+            continue
+        result = run_case(cls, payload(), args.number)
+        results[name] = result
+        print(f"{name:22s} {result['rows']:8d} {result['construct_ms']:9.2f} ms "
+              f"{result['dataframe_ms']:9.4f} ms {result['rows_per_second']:12,.0f} "
+              f"{result['peak_mb']:7.1f} MB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = list(_regressions(results, baseline, args.tolerance))
+        for regression in regressions:
+            print(f"regression: {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""synthetic fitbit web api responses, shaped like the real ones
+
+each generator returns the json a ``fitbit_classes`` parser receives for
+one day, or for a date range where fitbit has a range endpoint.  values
+are random but reproducible, from a generator seeded with ``seed``.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+
+def _days(start, days):
+    first = date.fromisoformat(start)
+    return [first + timedelta(days=n) for n in range(days)]
+
+
+def _clock(seconds):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def heart_rate(day, interval=60, seed=0):
+    """`activities/heart` intraday response for one day at ``interval`` seconds"""
+    rng = random.Random(seed)
+    zones = [
+        {"caloriesOut": rng.uniform(0, 1500), "max": high, "min": low,
+         "minutes": rng.randint(0, 600), "name": name}
+        for name, low, high in [("Out of Range", 30, 86), ("Fat Burn", 86, 121),
+                                ("Cardio", 121, 147), ("Peak", 147, 220)]
+    ]
+    return {
+        "activities-heart": [{
+            "dateTime": day,
+            "value": {
+                "customHeartRateZones": [],
+                "heartRateZones": zones,
+                "restingHeartRate": rng.randint(50, 80),
+            },
+        }],
+        "activities-heart-intraday": {
+            "dataset": [
+                {"time": _clock(second), "value": rng.randint(50, 180)}
+                for second in range(0, 86400, interval)
+            ],
+            "datasetInterval": 1 if interval == 1 else interval // 60,
+            "datasetType": "second" if interval == 1 else "minute",
+        },
+    }
+
+
+def activity(activity_type, day, seed=0):
+    """`activities/<type>` 1 minute intraday response for one day"""
+    rng = random.Random(seed)
+    if activity_type in ("steps", "floors"):
+        value = lambda: rng.randint(0, 120)  # noqa: E731
+    else:
+        value = lambda: round(rng.uniform(0, 10), 3)  # noqa: E731
+
+    dataset = []
+    for minute in range(1440):
+        record = {"time": _clock(minute * 60), "value": value()}
+        if activity_type == "calories":
+            record.update(level=rng.randint(0, 3), mets=rng.randint(10, 60))
+        dataset.append(record)
+
+    return {
+        f"activities-{activity_type}": [{"dateTime": day, "value": str(sum(r["value"] for r in dataset))}],
+        f"activities-{activity_type}-intraday": {
+            "dataset": dataset, "datasetInterval": 1, "datasetType": "minute",
+        },
+    }
+
+
+def hrv(start, days=1, seed=0):
+    """`hrv/date/<start>/<end>/all` response, 288 five minute readings a day"""
+    rng = random.Random(seed)
+    return {
+        "hrv": [
+            {
+                "dateTime": day.isoformat(),
+                "minutes": [
+                    {
+                        "minute": (datetime(day.year, day.month, day.day)
+                                   + timedelta(minutes=5 * n)).isoformat(timespec="milliseconds"),
+                        "value": {
+                            "rmssd": round(rng.uniform(10, 90), 3),
+                            "coverage": round(rng.uniform(0.8, 1), 3),
+                            "hf": round(rng.uniform(50, 1500), 3),
+                            "lf": round(rng.uniform(50, 1500), 3),
+                        },
+                    }
+                    for n in range(288)
+                ],
+            }
+            for day in _days(start, days)
+        ]
+    }
+
+
+def spo2(start, days=1, minutes=480, seed=0):
+    """`spo2/date/<start>/<end>/all` response, a reading a minute over a night"""
+    rng = random.Random(seed)
+    response = [
+        {
+            "dateTime": day.isoformat(),
+            "minutes": [
+                {
+                    "minute": (datetime(day.year, day.month, day.day)
+                               + timedelta(minutes=n, seconds=17)).isoformat(),
+                    "value": round(rng.uniform(90, 100), 1),
+                }
+                for n in range(minutes)
+            ],
+        }
+        for day in _days(start, days)
+    ]
+    return response if days > 1 else response[0]
+
+
+def breathing_rate(start, days=1, seed=0):
+    """`br/date/<start>/<end>/all` response"""
+    rng = random.Random(seed)
+    return {
+        "br": [
+            {
+                "dateTime": day.isoformat(),
+                "value": {
+                    f"{stage}SleepSummary": {"breathingRate": round(rng.uniform(12, 20), 1)}
+                    for stage in ("deep", "rem", "full", "light")
+                },
+            }
+            for day in _days(start, days)
+        ]
+    }
+
+
+def sleep(start, days=1, stages=120, seed=0):
+    """`sleep/date/<start>/<end>` response, a night with ``stages`` stages per day"""
+    rng = random.Random(seed)
+    sleeps = []
+    for n, day in enumerate(_days(start, days)):
+        begin = datetime(day.year, day.month, day.day) - timedelta(hours=1)
+        now = begin
+        data = []
+        for _ in range(stages):
+            seconds = 30 * rng.randint(1, 60)
+            data.append({
+                "dateTime": now.isoformat(timespec="milliseconds"),
+                "level": rng.choice(["deep", "light", "rem", "wake"]),
+                "seconds": seconds,
+            })
+            now += timedelta(seconds=seconds)
+        short_data = [
+            {"dateTime": record["dateTime"], "level": "wake", "seconds": 30}
+            for record in rng.sample(data, stages // 10)
+        ]
+        summary = {
+            level: {"count": sum(r["level"] == level for r in data),
+                    "minutes": sum(r["seconds"] for r in data if r["level"] == level) // 60,
+                    "thirtyDayAvgMinutes": rng.randint(30, 240)}
+            for level in ("deep", "light", "rem", "wake")
+        }
+        duration = int((now - begin).total_seconds())
+        sleeps.append({
+            "dateOfSleep": day.isoformat(),
+            "duration": duration * 1000,
+            "efficiency": rng.randint(80, 100),
+            "endTime": now.isoformat(timespec="milliseconds"),
+            "infoCode": 0,
+            "isMainSleep": True,
+            "levels": {"data": data, "shortData": short_data, "summary": summary},
+            "logId": 26013218219 + n,
+            "minutesAfterWakeup": 0,
+            "minutesAsleep": (duration - summary["wake"]["minutes"] * 60) // 60,
+            "minutesAwake": summary["wake"]["minutes"],
+            "minutesToFallAsleep": 0,
+            "logType": "auto_detected",
+            "startTime": begin.isoformat(timespec="milliseconds"),
+            "timeInBed": duration // 60,
+            "type": "stages",
+        })
+
+    return {"sleep": sleeps}
+
+
+def daily_activity(start, days=1, activities=3, seed=0):
+    """`activities/date/<day>` response, the summary and ``activities`` logged activities"""
+    rng = random.Random(seed)
+    day = date.fromisoformat(start)
+    logs = [
+        {
+            "activityId": 90009, "activityParentId": 90009, "activityParentName": "Run",
+            "calories": rng.randint(100, 600), "description": "Running - 5 mph (12 min/mile)",
+            "distance": round(rng.uniform(1, 10), 2), "duration": rng.randint(10, 90) * 60000,
+            "hasActiveZoneMinutes": True, "hasStartTime": True, "isFavorite": False,
+            "logId": 1000 * day.toordinal() + n, "name": "Run", "startDate": start,
+            "startTime": _clock(rng.randint(6, 20) * 3600), "steps": rng.randint(1000, 12000),
+        }
+        for n in range(activities)
+    ]
+    summary = {
+        "activeScore": -1, "activityCalories": rng.randint(200, 1500),
+        "caloriesBMR": rng.randint(1400, 1800), "caloriesOut": rng.randint(1800, 3500),
+        "elevation": round(rng.uniform(0, 100), 2), "fairlyActiveMinutes": rng.randint(0, 60),
+        "floors": rng.randint(0, 30), "lightlyActiveMinutes": rng.randint(60, 300),
+        "marginalCalories": rng.randint(100, 800), "restingHeartRate": rng.randint(50, 75),
+        "sedentaryMinutes": rng.randint(400, 900), "veryActiveMinutes": rng.randint(0, 90),
+        "steps": rng.randint(2000, 20000),
+    }
+    return {"activities": logs, "goals": activity_goals()["goals"], "summary": summary}
+
+
+def nutrition(start, days=1, foods=5, seed=0):
+    """`foods/log/date/<day>` response with ``foods`` logged foods"""
+    rng = random.Random(seed)
+    day = date.fromisoformat(start)
+    logged = []
+    for n in range(foods):
+        values = {name: round(rng.uniform(0, 100), 1)
+                  for name in ("calories", "carbs", "fat", "fiber", "protein", "sodium")}
+        logged.append({
+            "isFavorite": False, "logDate": start, "logId": 1000 * day.toordinal() + n,
+            "loggedFood": {
+                "accessLevel": "PUBLIC", "amount": 1, "brand": "", "calories": int(values["calories"]),
+                "foodId": 82782 + n, "locale": "en_US", "mealTypeId": rng.randint(1, 7),
+                "name": "Chocolate, Milk", "unit": {"name": "bar", "plural": "bars"},
+            },
+            "nutritionalValues": values,
+        })
+    summary = {name: round(sum(food["nutritionalValues"][name] for food in logged), 1)
+               for name in ("calories", "carbs", "fat", "fiber", "protein", "sodium")}
+    summary["water"] = rng.randint(0, 3000)
+    return {"foods": logged, "goals": nutrition_goals()["goals"], "summary": summary}
+
+
+def body_weight(start, days=1, seed=0):
+    """`body/log/weight/date/<start>/<end>` response, one weigh-in per day"""
+    rng = random.Random(seed)
+    return {
+        "weight": [
+            {"bmi": round(rng.uniform(20, 28), 2), "date": day.isoformat(),
+             "fat": round(rng.uniform(10, 30), 1), "logId": 1000 * day.toordinal(),
+             "source": "Aria", "time": "07:30:00", "weight": round(rng.uniform(60, 90), 1)}
+            for day in _days(start, days)
+        ]
+    }
+
+
+def activity_goals():
+    """`activities/goals/daily` response"""
+    return {"goals": {"activeMinutes": 30, "caloriesOut": 2500, "distance": 8.05,
+                      "floors": 10, "steps": 10000}}
+
+
+def nutrition_goals():
+    """`foods/log/goal` response"""
+    return {"goals": {"calories": 2200}}
+
+
+def badges(count=20):
+    """`badges` response with ``count`` badges"""
+    return {
+        "badges": [
+            {"badgeGradientEndColor": "00D3D6", "badgeGradientStartColor": "007273",
+             "badgeType": "DAILY_STEPS", "category": "Daily Steps", "dateTime": "2022-01-01",
+             "description": f"{1000 * n} steps on a day", "name": f"{1000 * n} steps",
+             "shortName": f"{1000 * n}", "timesAchieved": n, "value": 1000 * n, "unit": "STEPS"}
+            for n in range(1, count + 1)
+        ]
+    }
+
+
+def friends(count=10):
+    """`friends` response with ``count`` friends"""
+    return {
+        "data": [
+            {"type": "person", "id": f"2{n:05d}",
+             "attributes": {"name": f"friend {n}", "friend": True, "avatar": "", "child": False}}
+            for n in range(count)
+        ]
+    }